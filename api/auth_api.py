@@ -1,15 +1,19 @@
 import os
+import json
+import hashlib
 import time
 import requests
+import threading
+from api import http_client
+from utils.local_db import STATE_DIR
+from utils.state_files import atomic_write_json
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 FLIP_BASE_URL = os.getenv('FLIP_BASE_URL')
 REFRESH_TOKEN = os.getenv('REFRESH_TOKEN')
@@ -19,27 +23,92 @@ DEVICE_FP = os.getenv('DEVICE_FP')
 REFRESH_TOKEN_PATH = os.getenv('REFRESH_TOKEN_PATH')
 X_FLIPINATOR_TOOLS = os.getenv('X_FLIPINATOR_TOOLS')
 
+TOKEN_CACHE_PATH = os.getenv('TOKEN_CACHE_PATH', os.path.join(STATE_DIR, 'token.json'))
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('TOKEN_REFRESH_MARGIN_SECONDS', '300'))
+
 TOKEN_CACHE = {
     'data': None,
     'last_updated': None
 }
+HEADERS_CACHE = {
+    'token': None,
+    'headers': None
+}
+_refresh_lock = threading.Lock()
+
+# ties a cached token to the API and refresh token it came from, so changing either
+# in the environment never reuses a token issued for the old one
+def _cache_binding():
+    return hashlib.sha256(f'{FLIP_BASE_URL}\n{REFRESH_TOKEN}'.encode()).hexdigest()
+
+# (accessToken, expiresAt) from a refresh response, None if it isn't shaped like one
+def _auth_fields(token_data):
+    try:
+        auth = token_data['data']['auth']
+        access_token, expires_at = auth['accessToken'], auth['expiresAt']
+    except (KeyError, TypeError):
+        return None
+    if not access_token or not isinstance(expires_at, (int, float)):
+        return None
+    return access_token, expires_at
 
 def store_token_data(data):
     TOKEN_CACHE['data'] = data
     TOKEN_CACHE['last_updated'] = datetime.now().timestamp()
     logger.info("Token stored in memory cache")
 
+    # persist for the next process, readable by the owner only
+    try:
+        atomic_write_json(TOKEN_CACHE_PATH, {'binding': _cache_binding(), 'response': data}, mode=0o600)
+    except OSError as e:
+        logger.warning(f"Failed to persist token to {TOKEN_CACHE_PATH}: {e}")
+
 def load_token_data():
+    if TOKEN_CACHE['data'] is None and os.path.exists(TOKEN_CACHE_PATH):
+        try:
+            with open(TOKEN_CACHE_PATH) as f:
+                cached = json.load(f)
+            if not isinstance(cached, dict) or cached.get('binding') != _cache_binding():
+                raise ValueError('issued for a different FLIP_BASE_URL/REFRESH_TOKEN')
+            token_data = cached.get('response')
+            if _auth_fields(token_data) is None:
+                raise ValueError('missing data.auth.accessToken/expiresAt')
+            TOKEN_CACHE['data'] = token_data
+            TOKEN_CACHE['last_updated'] = os.path.getmtime(TOKEN_CACHE_PATH)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable token cache {TOKEN_CACHE_PATH}: {e}")
     return TOKEN_CACHE['data']
 
+# forget a token the server refused (401), in memory and on disk, so the next call
+# refreshes. with stale_token set, a token another thread already replaced is kept
+def invalidate_token(stale_token=None):
+    with _refresh_lock:
+        fields = _auth_fields(TOKEN_CACHE['data'])
+        if stale_token is not None and (fields is None or fields[0] != stale_token):
+            return
+        TOKEN_CACHE['data'] = None
+        TOKEN_CACHE['last_updated'] = None
+        HEADERS_CACHE['token'] = None
+        HEADERS_CACHE['headers'] = None
+        try:
+            os.remove(TOKEN_CACHE_PATH)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove token cache {TOKEN_CACHE_PATH}: {e}")
+        logger.warning("Access token was rejected, dropped it from the cache")
+
+# tokens count as expired TOKEN_REFRESH_MARGIN_SECONDS early so they are refreshed
+# before a request can fail on them
 def is_token_valid(token_data):
-    if not token_data:
+    fields = _auth_fields(token_data)
+    if not fields:
         return False
         
     current_time = int(time.time() * 1000)
     
-    if current_time >= token_data['data']['auth']['expiresAt']:
-        logger.info("Token has expired")
+    if current_time + TOKEN_REFRESH_MARGIN_SECONDS * 1000 >= fields[1]:
+        logger.info("Token has expired or is about to")
         return False
         
     return True
@@ -61,12 +130,20 @@ def refresh_access_token():
     }
     
     try:
-        response = requests.post(url=url, headers=headers, json=parameters)
+        response = http_client.post(url=url, group='auth', headers=headers, json=parameters)
         response.raise_for_status()
         token_data = response.json()
+        fields = _auth_fields(token_data)
+        if fields is None:
+            # never cached, so the next call asks again instead of reusing a bad response
+            logger.error(f"Refresh response has no access token/expiry: {str(token_data)[:500]}")
+            return None
         store_token_data(token_data)
         logger.info("Successfully refreshed access token")
-        return token_data['data']['auth']['accessToken']
+        return fields[0]
+    except ValueError as e:
+        logger.error(f"Failed to refresh access token, response is not json: {str(e)}")
+        return None
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to refresh access token: {str(e)}")
         if hasattr(e, 'response') and e.response is not None:
@@ -80,18 +157,25 @@ def get_flip_access_token():
     if is_token_valid(token_data):
         # logger.info("Using cached access token")
         return token_data['data']['auth']['accessToken']
-        
-    logger.info("Access token is missing or expired. Refreshing token...")
-    return refresh_access_token()
 
-def get_headers(token):
-    token = get_flip_access_token()
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Authorization": f"Bearer {token}",
-        "x-flipinator-tools": X_FLIPINATOR_TOOLS
-    }
-    return headers
+    # only one thread refreshes, the rest wait and reuse its token
+    with _refresh_lock:
+        token_data = load_token_data()
+        if is_token_valid(token_data):
+            return token_data['data']['auth']['accessToken']
+        logger.info("Access token is missing or expired. Refreshing token...")
+        return refresh_access_token()
+
+def get_headers(token=None):
+    token = get_flip_access_token() or token
+    if HEADERS_CACHE['token'] != token:
+        HEADERS_CACHE['headers'] = {
+            "Accept": "application/json, text/plain, */*",
+            "Authorization": f"Bearer {token}",
+            "x-flipinator-tools": X_FLIPINATOR_TOOLS
+        }
+        HEADERS_CACHE['token'] = token
+    return HEADERS_CACHE['headers']
 
 if __name__ == "__main__":
     token = get_flip_access_token()
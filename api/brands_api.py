@@ -2,59 +2,63 @@ import os
 import logging
 import requests
 import json
+import threading
+from api import http_client
 from api.auth_api import get_headers, get_flip_access_token
+from utils import brand_index
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 FLIP_BASE_URL = os.getenv('FLIP_BASE_URL')
+FLIP_ONBOARDING_REP_ID = os.getenv('FLIP_ONBOARDING_REP_ID')
+BRAND_PAGE_SIZE = int(os.getenv('BRAND_PAGE_SIZE', '100'))
 CREATE_BRAND_PATH = '/shop/admin/brands/onboarding/outbound/v1'
 GET_ALL_BRANDS_PATH = '/shop/admin/brands/onboarding/list/v2'
 UPDATE_PROFILE_PATH = '/shop/admin/brands/onboarding/update/v1'
 PREAPPROVE_BRAND_PATH = '/shop/admin/brands/onboarding/{brand_id}/start-onboarding/v1'
 ASSIGN_BRAND_PATH = '/shop/admin/brands/onboarding/{brand_id}/call/onboarding-assign/v1'
 UPDATE_CS_EMAIL_PATH = '/shop/brands/management/request-customer-support-email-change/v1'
+# where update_return_addr points brands; change this for a warehouse move
+RETURN_ADDRESS = {
+    'receiverName': 'DS Flip Returns',
+    'city': 'Corona',
+    'street': '1235 Quarry St',
+    'postalCode': '92879'
+}
+# create_brand's result when the name is already taken
+BRAND_EXISTS = 'exists'
 
 # /shop/admin/brands/onboarding/update/v1
-def update_return_addr(brand_id, token, retry=True):
+def update_return_addr(brand_id, token, address=None):
     url = f'{FLIP_BASE_URL}{UPDATE_PROFILE_PATH}'
     headers = get_headers()
+    address = address or RETURN_ADDRESS
     payload = {
         'id': brand_id,
         'operationData': {
-            'orderReturnDCAddress': {
-                'receiverName': 'DS Flip Returns',
-                'city': 'Corona',
-                'street': '1235 Quarry St',
-                'postalCode': '92879'
-            },
+            'orderReturnDCAddress': address,
         'isShippingOriginAddressSameAsOrderReturnDCAddress': True
         }
     }
     try:
-        response = requests.patch(url, headers=headers, json=payload)
+        response = http_client.patch(url, group='brand_admin', headers=headers, json=payload)
+        # a 401 has already been retried with a fresh token by http_client
         response.raise_for_status()
-        if response.status_code in (200, 201):
-            print(f'successfully processed brand: {brand_id}')
-            return response.json()
-        elif response.status_code == 401 and retry:
-            print("Received 401. Attempting to refresh access token and retry.")
-            new_token = get_flip_access_token()
-            if new_token and new_token != token:
-                return update_return_addr(brand_id, new_token, retry=False)
-        return None
+        logger.debug('successfully processed brand: %s', brand_id)
+        brand_index.set_return_address(brand_id, address)
+        return response.json()
     except requests.exceptions.RequestException as e:
-        print(f'error processing brand: {brand_id}: {e}')
+        logger.error(f'error processing brand: {brand_id}: {e}')
         return None
 
 def format_email(brand_name):
     return f"flip+{brand_name.lower().replace(' ', '')}@flipshop.com" #UPDATE THIS
 
 # /shop/admin/brands/onboarding/outbound/v1
-def create_brand(brand_name, token):
+def create_brand(brand_name, token=None, brand_data=None):
     url = f'{FLIP_BASE_URL}{CREATE_BRAND_PATH}'
     token = get_flip_access_token()  
     headers = get_headers(token)
@@ -75,39 +79,112 @@ def create_brand(brand_name, token):
         "genders": ["unisex"],
         "brandGoalsOnFlip": ["increaseSales"]
     }
+    # caller supplied values (e.g. from an onboarding sheet) win over the placeholders
+    for key, value in (brand_data or {}).items():
+        if key in payload and value:
+            payload[key] = value
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = http_client.post(url, group='brand_admin', headers=headers, json=payload)
         response.raise_for_status()
-        print(f"Successfully processed brand: {brand_name}")
+        logger.info(f"Successfully processed brand: {brand_name}")
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error processing brand {brand_name}: {e}")
+        if _is_name_conflict(e):
+            logger.warning(f"Brand {brand_name} already exists")
+            return BRAND_EXISTS
+        logger.error(f"Error processing brand {brand_name}: {e}")
         return None
 
+# the create call was refused because a brand with that name exists
+def _is_name_conflict(error):
+    response = getattr(error, 'response', None)
+    if response is None or response.status_code not in (400, 409):
+        return False
+    try:
+        message = (response.json().get('message') or '').lower()
+    except ValueError:
+        message = ''
+    return response.status_code == 409 or 'already exists' in message
+
 # /shop/admin/brands/onboarding/list/v2
-def lookup_brand_by_name(brand_name):
-    logger.info(f"Looking up brand: {brand_name}")
-    
+def list_brands(page=1, limit=BRAND_PAGE_SIZE, name=None):
     url = f"{FLIP_BASE_URL}{GET_ALL_BRANDS_PATH}"
     payload = {
-        "page": 1,
-        "limit": 10,
-        "name": brand_name,
+        "page": page,
+        "limit": limit,
         "sort": "createdAt",
         "order": "desc"
     }
-    
+    if name:
+        payload["name"] = name
+    response = http_client.post(url=url, group='brand_admin', headers=get_headers(), json=payload)
+    response.raise_for_status()
+    return response.json().get('data') or []
+
+_refresh_lock = threading.Lock()
+
+# pages the brand list newest first into the local index. after the first full
+# pass only pages newer than the createdAt watermark are fetched
+def refresh_brand_index(full=False, force=False):
+    with _refresh_lock:
+        if not (full or force or brand_index.is_stale()):
+            return
+        watermark = None if full else brand_index.get_watermark()
+        newest = watermark
+        page = 1
+        fetched = 0
+        while True:
+            brands = list_brands(page=page, limit=BRAND_PAGE_SIZE)
+            brand_index.index_brands(brands)
+            fetched += len(brands)
+            created = [str(brand['createdAt']) for brand in brands if brand.get('createdAt') is not None]
+            if created:
+                newest = max(created + ([newest] if newest else []))
+            if len(brands) < BRAND_PAGE_SIZE:
+                break
+            if watermark and created and min(created) <= watermark:
+                break
+            page += 1
+        if newest:
+            brand_index.set_watermark(newest)
+        brand_index.mark_refreshed()
+        logger.info(f'brand index refreshed: {fetched} brands fetched, {brand_index.count()} indexed')
+
+# served from the local brand index; the API's fuzzy name search is only a fallback
+# for brands created since the last refresh that the refresh itself could not reach.
+# exact skips the normalized-name match ("Acme Co" won't find "ACME-CO")
+def lookup_brand_by_name(brand_name, exact=False):
+    logger.info(f"Looking up brand: {brand_name}")
+
     try:
-        response = requests.post(url=url, headers=get_headers(), json=payload)
-        response.raise_for_status()
-        response_data = response.json()
-        
-        if not response_data.get('data') or len(response_data['data']) == 0:
+        refresh_brand_index()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not refresh brand index, using what is indexed: {str(e)}")
+    brand_data = brand_index.find_by_name(brand_name, exact=exact)
+    if brand_data:
+        logger.info(f"Found brand: {brand_data['name']} with ID: {brand_data['id']}")
+        return brand_data
+
+    try:
+        # a brand created moments ago (e.g. by onboarding) is newer than the index
+        refresh_brand_index(force=True)
+        brand_data = brand_index.find_by_name(brand_name, exact=exact)
+        if not brand_data:
+            brands = list_brands(page=1, limit=10, name=brand_name)
+            brand_index.index_brands(brands)
+            brand_data = next(
+                (brand for brand in brands
+                 if brand.get('name') == brand_name or (
+                     not exact
+                     and brand_index.normalize_brand_name(brand.get('name')) == brand_index.normalize_brand_name(brand_name)
+                 )),
+                None
+            )
+        if not brand_data:
             logger.error(f"Brand '{brand_name}' not found")
             return None
-            
-        brand_data = response_data['data'][0]
+
         logger.info(f"Found brand: {brand_data['name']} with ID: {brand_data['id']}")
         return brand_data
         
@@ -122,7 +199,7 @@ def lookup_brand_by_name(brand_name):
 def pre_approve_brand(brand_id):
     logger.info(f"Pre-approving brand with ID: {brand_id}")
     
-    url = f"{FLIP_BASE_URL}{PREAPPROVE_BRAND_PATH}"
+    url = f"{FLIP_BASE_URL}{PREAPPROVE_BRAND_PATH}".format(brand_id=brand_id)
     payload = {
         "flipMargin": 15,
         "businessType": "dropShip",
@@ -130,7 +207,7 @@ def pre_approve_brand(brand_id):
     }
     
     try:
-        response = requests.post(url=url, headers=get_headers(), json=payload)
+        response = http_client.post(url=url, group='brand_admin', headers=get_headers(), json=payload)
         response.raise_for_status()
         logger.info(f"Successfully pre-approved brand with ID: {brand_id}")
         return True
@@ -151,22 +228,19 @@ def pre_approve_brand(brand_id):
         if hasattr(e, 'response') and e.response is not None:
             logger.error(f"Response status code: {e.response.status_code}")
             logger.error(f"Response content: {e.response.text}")
-        
-        # Continue with the rest of the steps even if pre-approval fails
-        logger.warning(f"Continuing with next steps despite pre-approval failure for brand ID: {brand_id}")
-        return True
+        return False
 
 # /shop/admin/brands/onboarding/{brand_id}/call/onboarding-assign/v1
 def assign_brand_to_rep(brand_id):
     logger.info(f"Assigning brand with ID: {brand_id} to rep")
     
-    url = f"{FLIP_BASE_URL}{ASSIGN_BRAND_PATH}".format()
+    url = f"{FLIP_BASE_URL}{ASSIGN_BRAND_PATH}".format(brand_id=brand_id)
     payload = {
         "flipOnboardingRepresentativeId": FLIP_ONBOARDING_REP_ID
     }
     
     try:
-        response = requests.post(url=url, headers=get_flip_headers(), json=payload)
+        response = http_client.post(url=url, group='brand_admin', headers=get_headers(), json=payload)
         response.raise_for_status()
         logger.info(f"Successfully assigned brand with ID: {brand_id} to rep")
         return True
@@ -187,13 +261,10 @@ def assign_brand_to_rep(brand_id):
         if hasattr(e, 'response') and e.response is not None:
             logger.error(f"Response status code: {e.response.status_code}")
             logger.error(f"Response content: {e.response.text}")
-        
-        # Continue with the rest of the steps even if rep assignment fails
-        logger.warning(f"Continuing with next steps despite rep assignment failure for brand ID: {brand_id}")
-        return True
+        return False
 
 # /shop/brands/management/request-customer-support-email-change/v1
-def update_customer_support_email(brand_id):
+def update_customer_support_email(brand_id, cs_email):
     logger.info(f"Updating customer support email for brand with ID: {brand_id}")
     
     url = f"{FLIP_BASE_URL}{UPDATE_CS_EMAIL_PATH}"
@@ -204,7 +275,7 @@ def update_customer_support_email(brand_id):
     }
     
     try:
-        response = requests.post(url=url, headers=get_headers(), json=payload)
+        response = http_client.post(url=url, group='brand_admin', headers=get_headers(), json=payload)
         response.raise_for_status()
         logger.info(f"Successfully updated customer support email for brand with ID: {brand_id}")
         return True
@@ -213,9 +284,7 @@ def update_customer_support_email(brand_id):
         if hasattr(e, 'response') and e.response is not None:
             logger.error(f"Response status code: {e.response.status_code}")
             logger.error(f"Response content: {e.response.text}")
-        # Continue with the rest of the steps
-        logger.warning(f"Continuing with next steps despite customer support email update failure for brand ID: {brand_id}")
-        return True
+        return False
 
 
 def update_brand_profile(brand_id, brand_name, user_supplied_data, perplexity_data):
@@ -274,7 +343,7 @@ def update_brand_profile(brand_id, brand_name, user_supplied_data, perplexity_da
     
     try:
         # Use PATCH method instead of POST
-        response = requests.patch(url=url, headers=get_headers(), json=payload)
+        response = http_client.patch(url=url, group='brand_admin', headers=get_headers(), json=payload)
         response.raise_for_status()
         logger.info(f"Successfully updated profile for brand with ID: {brand_id}")
         return True
@@ -302,7 +371,7 @@ def update_brand_profile(brand_id, brand_name, user_supplied_data, perplexity_da
                     
                     if needs_retry:
                         logger.info(f"Retrying profile update with fixed URLs for {brand_name}")
-                        retry_response = requests.patch(url=url, headers=get_flip_headers(), json=retry_payload)
+                        retry_response = http_client.patch(url=url, group='brand_admin', headers=get_headers(), json=retry_payload)
                         retry_response.raise_for_status()
                         logger.info(f"Successfully updated profile for brand with ID: {brand_id} after URL fix")
                         return True
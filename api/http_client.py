@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from api import rate_limiter
+from utils import metrics, profiling
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+HTTP_MAX_429_RETRIES = int(os.getenv('HTTP_MAX_429_RETRIES', '5'))
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+def _build_session():
+    # connection errors are retried for every method since nothing reached the server.
+    # 5xx / read errors are only retried for idempotent methods (urllib3 default), so a
+    # cancel or approve POST is never sent twice by the transport. 429s are left to
+    # the rate limiter so it can see them and back the whole group off
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# one keep-alive session shared by every api module and worker thread
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+# every call goes through its endpoint group's limiter. a 429 means the server
+# did not process the request, so it is retried (any method) once the group's
+# Retry-After pause has passed. a 401 on an authorized call drops the cached token
+# and is retried once with a fresh one. each attempt is recorded in the metrics registry
+def request(method, url, group=None, **kwargs):
+    response = _send(method, url, group, **kwargs)
+    authorization = (kwargs.get('headers') or {}).get('Authorization')
+    if response.status_code == 401 and authorization:
+        # imported here, auth_api itself sends its refresh through this module
+        from api import auth_api
+        auth_api.invalidate_token(authorization.removeprefix('Bearer '))
+        token = auth_api.get_flip_access_token()
+        if token:
+            kwargs['headers'] = dict(kwargs['headers'], **auth_api.get_headers(token))
+            response = _send(method, url, group, **kwargs)
+    return response
+
+def _send(method, url, group=None, **kwargs):
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    limiter = rate_limiter.get_group(group)
+    endpoint = metrics.endpoint_label(method, url)
+    for attempt in range(HTTP_MAX_429_RETRIES + 1):
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            with profiling.activity('network'):
+                response = get_session().request(method, url, **kwargs)
+        except Exception:
+            limiter.release()
+            metrics.observe(group or 'default', endpoint, time.monotonic() - start, error=True)
+            raise
+        latency = time.monotonic() - start
+        metrics.observe(group or 'default', endpoint, latency, error=response.status_code >= 400, received=len(response.content))
+        retry_after = rate_limiter.parse_retry_after(response.headers.get('Retry-After'))
+        if response.status_code == 429 and retry_after is None:
+            retry_after = rate_limiter.DEFAULT_RETRY_AFTER * 2 ** attempt
+        limiter.release(response.status_code, latency, retry_after)
+        if response.status_code != 429:
+            break
+    return response
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+def patch(url, **kwargs):
+    return request('PATCH', url, **kwargs)
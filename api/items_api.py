@@ -1,36 +1,71 @@
 import os
 import logging
 import requests
-from api.auth_api import get_headers, get_flip_access_token
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from api import http_client
+from api.auth_api import get_headers
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 FLIP_BASE_URL = os.getenv('FLIP_BASE_URL')
 FLIP_DISABLE_SKUS_PATH = os.getenv('FLIP_DISABLE_SKUS_PATH')
-X_FLIPINATOR_TOOLS = os.getenv('X_FLIPINATOR_TOOLS')
+SKU_DISABLE_CHUNK_SIZE = int(os.getenv('SKU_DISABLE_CHUNK_SIZE', '200'))
+SKU_DISABLE_WORKERS = int(os.getenv('SKU_DISABLE_WORKERS', '4'))
+# the server refused something in the payload, splitting the chunk finds the bad skus
+PAYLOAD_REJECTED_STATUSES = {400, 422}
+# auth or routing is wrong, no chunk can succeed so the rest of the run is abandoned
+FATAL_STATUSES = {401, 403, 404}
 
-def disable_sku(sku, token, audit_status="connectivity"):
-    headers = {
-        "accept": "application/json, text/plain, */*",
-        "authorization": f"Bearer {token}",
-        "x-flipinator-tools": X_FLIPINATOR_TOOLS
-    }
+# one PUT for a whole chunk. a payload rejection fails every sku in it, so the
+# chunk is split in half until the skus the server refuses are isolated
+def _disable_chunk(skus, token, audit_status, abort):
+    if abort.is_set():
+        return {sku: (False, 'not sent, an earlier chunk hit an auth or routing error') for sku in skus}
     payload = {
-        "skus": [sku],
+        "skus": skus,
         "auditStatus": audit_status
     }
     try:
         disable_skus_url = f'{FLIP_BASE_URL}{FLIP_DISABLE_SKUS_PATH}'
-        response = requests.put(disable_skus_url, headers=headers, json=payload)
+        response = http_client.put(disable_skus_url, group='catalog', headers=get_headers(token), json=payload)
         response.raise_for_status()
-        resp_data = response.json()
-        logger.info(f"Disabled SKU {sku} with auditStatus '{audit_status}': {resp_data}")
+        logger.info(f"Disabled {len(skus)} SKUs with auditStatus '{audit_status}'")
+        return {sku: (True, None) for sku in skus}
     except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to disable SKU {sku}: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            logger.error(f"Response status code: {e.response.status_code}")
+        status = e.response.status_code if getattr(e, 'response', None) is not None else None
+        if status in PAYLOAD_REJECTED_STATUSES and len(skus) > 1:
+            middle = len(skus) // 2
+            outcomes = _disable_chunk(skus[:middle], token, audit_status, abort)
+            outcomes.update(_disable_chunk(skus[middle:], token, audit_status, abort))
+            return outcomes
+        if status in FATAL_STATUSES:
+            abort.set()
+        logger.error(f"Failed to disable {len(skus)} SKUs starting at {skus[0]}: {e}")
+        if status is not None:
+            logger.error(f"Response status code: {status}")
             logger.error(f"Response content: {e.response.text}")
+        detail = e.response.text if status is not None else str(e)
+        return {sku: (False, detail) for sku in skus}
+
+# {sku: (success, error detail or None)} for every sku passed in
+def disable_skus(skus, token, audit_status="connectivity", chunk_size=None, max_workers=None):
+    skus = list(dict.fromkeys(skus))
+    chunk_size = chunk_size or SKU_DISABLE_CHUNK_SIZE
+    chunks = [skus[i:i + chunk_size] for i in range(0, len(skus), chunk_size)]
+    outcomes = {}
+    abort = threading.Event()
+    with ThreadPoolExecutor(max_workers=max_workers or SKU_DISABLE_WORKERS) as executor:
+        futures = [executor.submit(_disable_chunk, chunk, token, audit_status, abort) for chunk in chunks]
+        for future in as_completed(futures):
+            outcomes.update(future.result())
+    return outcomes
+
+def disable_sku(sku, token, audit_status="connectivity"):
+    success, detail = disable_skus([sku], token, audit_status)[sku]
+    if success:
+        logger.info(f"Disabled SKU {sku} with auditStatus '{audit_status}'")
+    return success
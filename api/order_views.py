@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+
+ITEM_VIEW_CACHE_SIZE = 50000
+
+# compact projections of /api/order/{order_id} responses holding only the fields
+# the policies read. the raw JSON can be dropped as soon as an order is projected
+
+@dataclass
+class ItemView:
+    __slots__ = ('id', 'sku', 'category', 'description', 'long_description')
+    id: str
+    sku: str
+    category: str
+    description: str
+    long_description: str
+
+@dataclass
+class OrderView:
+    __slots__ = (
+        'id', 'orderID', 'state', 'tag', 'paymentMethodCode', 'deviceId', 'updatedAt',
+        'shipping_state', 'customer_status', 'items'
+    )
+    id: str
+    orderID: str
+    state: str
+    tag: str
+    paymentMethodCode: str
+    deviceId: str
+    updatedAt: str
+    shipping_state: str
+    customer_status: str
+    items: tuple
+
+# the same catalog item shows up across many orders, share one view per item revision.
+# the key is every projected field, so a re-categorized or re-described item gets a new view
+_item_views = {}
+
+def project_item(item_data):
+    fields = (
+        item_data.get('id'), item_data.get('sku'), item_data.get('category'),
+        item_data.get('description'), item_data.get('long_description')
+    )
+    cache_key = fields if fields[0] or fields[1] else None
+    view = _item_views.get(cache_key) if cache_key else None
+    if view is None:
+        view = ItemView(*fields)
+        if cache_key:
+            if len(_item_views) >= ITEM_VIEW_CACHE_SIZE:
+                _item_views.clear()
+            _item_views[cache_key] = view
+    return view
+
+def project_order(detail, order_id=None):
+    order = detail.get('order') or {}
+    return OrderView(
+        id=order.get('id') or order_id,
+        orderID=order.get('orderID'),
+        state=order.get('state'),
+        tag=order.get('tag'),
+        paymentMethodCode=order.get('paymentMethodCode'),
+        deviceId=order.get('deviceId'),
+        updatedAt=order.get('updatedAt'),
+        shipping_state=(order.get('shippingAddress') or {}).get('state'),
+        customer_status=(order.get('customer') or {}).get('orderStatus'),
+        items=tuple(project_item(line.get('item') or {}) for line in order.get('items') or [])
+    )
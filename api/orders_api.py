@@ -1,16 +1,23 @@
 import os
 import logging
 import requests
+import uuid
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from api import http_client
 from api.auth_api import get_headers
+from api.order_views import project_order
+from utils import detail_cache, order_index, mutation_journal, order_archive
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 FLIP_BASE_URL = os.getenv('FLIP_BASE_URL')
+ORDER_DETAIL_WORKERS = int(os.getenv('ORDER_DETAIL_WORKERS', '8'))
+ORDER_PAGE_SIZE = int(os.getenv('ORDER_PAGE_SIZE', '100'))
+MUTATION_WORKERS = int(os.getenv('MUTATION_WORKERS', '4'))
 ORDER_LIST_PATH = '/api/v2/order/list'
 ORDER_DETAIL_PATH = '/api/order/{order_id}'
 APPROVE_ORDER_PATH = '/shop/admin/orders/{order_id}/accept-order-in-pending-approval-state/v1'
@@ -23,6 +30,12 @@ ORDER_STATES = [
             "outboundTransit","backInOPS","returnConfirmed","returnConfirmedFailed",
             "completed","cancelled","paymentInReview","revisionFailed","pendingApproval"
             ]
+# states where an order can still be cancelled (nothing has shipped yet)
+OPEN_ORDER_STATES = [
+            "new","inStyling","activeStyling","OOSItem","OOSItemActive",
+            "stylistApproval","needAttention","OPS","OPSFailed","OPSProcessing",
+            "readyToShip","pendingPick","paymentInReview","revisionFailed","pendingApproval"
+            ]
 
 # /api/v2/order/list
 def list_orders(token, page=1, limit=100, states=None):
@@ -38,27 +51,101 @@ def list_orders(token, page=1, limit=100, states=None):
     }
 
     full_url = f'{url}?{urllib.parse.urlencode(params)}' #confim params are working
-    logger.info(f'calling list_orders url: {full_url}')
+    logger.debug('calling list_orders url: %s', full_url)
 
     headers = get_headers(token)
-    response = requests.get(url, headers=headers, params=params)
+    response = http_client.get(url, group='list', headers=headers, params=params)
     response.raise_for_status()
-    return response.json()
+    result = response.json()
+    order_archive.record('list', page=page, states=states, rows=result.get('data', []))
+    return result
+
+# walk every page of /api/v2/order/list, fetching the next page in the
+# background while the current one is consumed. stops on an empty or short page.
+# every page is written to the local order index
+def iter_orders(token, states=None, limit=None, max_orders=None):
+    limit = limit or ORDER_PAGE_SIZE
+    seen_ids = set()
+    yielded = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = 1
+        future = executor.submit(list_orders, token, page=page, limit=limit, states=states)
+        while future is not None:
+            orders = future.result().get('data', [])
+            order_index.index_list_rows(orders)
+            future = None
+            # a page of nothing but repeats means the server isn't advancing
+            has_new = any(order['id'] not in seen_ids for order in orders)
+            more_wanted = max_orders is None or yielded + len(orders) < max_orders
+            if len(orders) >= limit and has_new and more_wanted:
+                page += 1
+                future = executor.submit(list_orders, token, page=page, limit=limit, states=states)
+
+            for order in orders:
+                # orders created mid-walk shift later pages, skip any repeats
+                if order['id'] in seen_ids:
+                    continue
+                seen_ids.add(order['id'])
+                yield order
+                yielded += 1
+                if max_orders is not None and yielded >= max_orders:
+                    return
 
 # /api/order/{order_id}
-def get_order_details(token, order_id):  
+# read-through the local detail cache. state/updated_at from the list row let a
+# cached copy be reused only while the order is unchanged
+def get_order_details(token, order_id, state=None, updated_at=None, use_cache=True):
+    if use_cache:
+        cached = detail_cache.get(order_id, state=state, updated_at=updated_at)
+        if cached is not None:
+            order_archive.record('detail', id=order_id, detail=cached)
+            return cached
+
     url = f'{FLIP_BASE_URL}{ORDER_DETAIL_PATH}'.format(order_id=order_id)
     headers = get_headers(token)
-    response = requests.get(url, headers=headers)
+    response = http_client.get(url, group='detail', headers=headers)
     response.raise_for_status()
-    return response.json()
+    order_detail = response.json()
+    order_archive.record('detail', id=order_id, detail=order_detail)
+    if use_cache:
+        detail_cache.put(order_id, order_detail, state=state, updated_at=updated_at)
+    return order_detail
+
+def _get_order_details_safe(token, order):
+    # accepts either a bare order id or a list row carrying state/updatedAt
+    if isinstance(order, dict):
+        order_id, state, updated_at = order['id'], order.get('state'), order.get('updatedAt')
+    else:
+        order_id, state, updated_at = order, None, None
+    try:
+        order_detail = get_order_details(token, order_id, state=state, updated_at=updated_at)
+        logger.debug('fetched details for order %s', order_id)
+        return project_order(order_detail, order_id)
+    except Exception:
+        logger.exception(f'failed to fetch details for order {order_id}')
+        return None
+
+# fetch details for many orders (ids or list rows) with bounded parallelism.
+# each response is projected to a compact OrderView as soon as it arrives.
+# results line up with the input; failed fetches come back as None
+def get_order_details_many(token, orders, max_workers=None):
+    orders = list(orders)
+    if not orders:
+        return []
+    max_workers = max_workers or ORDER_DETAIL_WORKERS
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(orders))) as executor:
+        details = list(executor.map(lambda order: _get_order_details_safe(token, order), orders))
+    order_index.index_details(detail for detail in details if detail is not None)
+    logger.info(f"detail cache: {detail_cache.stats['hits']} hits / {detail_cache.stats['misses']} misses")
+    return details
 
 # /shop/admin/orders/{order_id}/accept-order-in-pending-approval-state/v1
 def approve_order(token, order_id):
     url = f'{FLIP_BASE_URL}{APPROVE_ORDER_PATH}'.format(order_id=order_id)
     headers = get_headers(token)
     try:
-        response = requests.post(url, headers=headers)
+        response = http_client.post(url, group='mutation', headers=headers)
+        detail_cache.invalidate(order_id)
         response.raise_for_status()
         result = response.json()
         success = result.get('success', False)
@@ -84,16 +171,96 @@ def cancel_order(token, order_id):
         "shouldCancelAdditionalOrders": False
     }
     try:
-        logger.info(f"attempting to cancel order id {order_id}")
-        response = requests.post(url, headers=headers, json=payload)
+        logger.debug('attempting to cancel order id %s', order_id)
+        response = http_client.post(url, group='mutation', headers=headers, json=payload)
+        detail_cache.invalidate(order_id)
         response.raise_for_status()
         data = response.json()
         result = data.get("data", {}).get("result")
         if result == "success":
             logger.info(f"successfully cancelled order {order_id}")
-        else:
-            logger.error(f"cancellation failed for order {order_id}. Response: {data}")
+            return True, data
+        logger.error(f"cancellation failed for order {order_id}. Response: {data}")
+        return False, data
     except requests.exceptions.RequestException as e:
         logger.error(f"error cancelling order {order_id}: {e}")
         if hasattr(e, 'response') and e.response is not None:
-            logger.error(f"status Code: {e.response.status_code} | response: {e.response.text}")
\ No newline at end of file
+            logger.error(f"status Code: {e.response.status_code} | response: {e.response.text}")
+            return False, e.response.text
+        return False, str(e)
+
+def _changed_since(updated_at, order_id, journaled_at):
+    order_updated = mutation_journal.to_timestamp((updated_at or {}).get(order_id))
+    return order_updated is not None and order_updated > journaled_at
+
+MUTATION_ACTIONS = {
+    'approve': approve_order,
+    'cancel': cancel_order,
+}
+
+# whether a mutation that was sent but never confirmed actually landed
+def _already_applied(token, action, order_id):
+    state = get_order_details(token, order_id, use_cache=False).get('order', {}).get('state')
+    if action == 'cancel':
+        return state == 'cancelled'
+    return state != 'pendingApproval'
+
+def _execute_mutation(token, run_id, action, order_id):
+    mutation_journal.record_intent(run_id, action, order_id)
+    try:
+        success, result = MUTATION_ACTIONS[action](token, order_id)
+    except Exception as e:
+        logger.exception(f'unexpected error running {action} on {order_id}')
+        success, result = False, str(e)
+    mutation_journal.record_outcome(run_id, action, order_id, success, None if success else str(result)[:500])
+    return success, result
+
+# run (action, order_id) pairs with bounded concurrency. every intent and outcome
+# goes to the local journal, so mutations that already succeeded are skipped and
+# ones interrupted mid-send are checked against the order before being resent.
+# updated_at ({order_id: updatedAt}) lets an order changed since its mutation
+# succeeded (e.g. back in pendingApproval) have it sent again.
+# returns {'succeeded': [...], 'failed': [...], 'skipped': [...]} of (action, order_id)
+def execute_mutations(token, mutations, max_workers=None, updated_at=None):
+    run_id = uuid.uuid4().hex
+    status = mutation_journal.load_status()
+    summary = {'succeeded': [], 'failed': [], 'skipped': []}
+
+    to_send = []
+    for action, order_id in dict.fromkeys(mutations):
+        if action not in MUTATION_ACTIONS:
+            raise ValueError(f'unknown mutation {action!r}')
+        prior, journaled_at = status.get((action, order_id), (None, None))
+        if prior == 'succeeded' and _changed_since(updated_at, order_id, journaled_at):
+            logger.info(f'{order_id} changed after an earlier {action} succeeded, sending it again')
+            prior = None
+        if prior == 'succeeded':
+            logger.info(f'{action} {order_id} already succeeded in an earlier run, skipping')
+            summary['skipped'].append((action, order_id))
+            continue
+        if prior == 'pending':
+            try:
+                applied = _already_applied(token, action, order_id)
+            except Exception:
+                logger.exception(f'could not check interrupted {action} on {order_id}, skipping it this run')
+                summary['failed'].append((action, order_id))
+                continue
+            if applied:
+                logger.info(f'interrupted {action} on {order_id} had already landed')
+                mutation_journal.record_outcome(run_id, action, order_id, True, 'confirmed after interruption')
+                summary['skipped'].append((action, order_id))
+                continue
+        to_send.append((action, order_id))
+
+    if to_send:
+        max_workers = max_workers or MUTATION_WORKERS
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(to_send))) as executor:
+            results = list(executor.map(lambda mutation: _execute_mutation(token, run_id, *mutation), to_send))
+        for mutation, (success, _) in zip(to_send, results):
+            summary['succeeded' if success else 'failed'].append(mutation)
+
+    logger.info(
+        f"mutations: {len(summary['succeeded'])} succeeded, {len(summary['failed'])} failed, "
+        f"{len(summary['skipped'])} already done"
+    )
+    return summary
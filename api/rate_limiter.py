@@ -0,0 +1,120 @@
+import os
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# group: (starting requests per second, max concurrent requests)
+GROUP_LIMITS = {
+    'list': (float(os.getenv('RATE_LIST_RPS', '5')), int(os.getenv('RATE_LIST_CONCURRENCY', '2'))),
+    'detail': (float(os.getenv('RATE_DETAIL_RPS', '25')), int(os.getenv('RATE_DETAIL_CONCURRENCY', '16'))),
+    'mutation': (float(os.getenv('RATE_MUTATION_RPS', '5')), int(os.getenv('RATE_MUTATION_CONCURRENCY', '4'))),
+    'brand_admin': (float(os.getenv('RATE_BRAND_RPS', '5')), int(os.getenv('RATE_BRAND_CONCURRENCY', '4'))),
+    'catalog': (float(os.getenv('RATE_CATALOG_RPS', '5')), int(os.getenv('RATE_CATALOG_CONCURRENCY', '4'))),
+    'auth': (1.0, 1),
+    'default': (5.0, 4),
+}
+MIN_RPS = 0.2
+RATE_CEILING_FACTOR = float(os.getenv('RATE_CEILING_FACTOR', '4')) # how far above its start rate a group may probe
+RPS_STEP = 0.25 # additive increase per successful request
+SLOW_LATENCY_FACTOR = 3.0 # latency this far above the best seen counts as congestion
+DEFAULT_RETRY_AFTER = 1.0
+DECREASE_COOLDOWN = 1.0 # a burst of 429s from requests already in flight only backs off once
+
+# token bucket plus an AIMD concurrency window for one group of endpoints.
+# 429s and latency spikes halve the window and rate, successes grow them back
+class EndpointGroup:
+    def __init__(self, name, rate, max_concurrency):
+        self.name = name
+        self.max_rate = rate * RATE_CEILING_FACTOR
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.tokens = max(1.0, rate)
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    self.cond.wait(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1 and self.in_flight < max(1, int(self.concurrency)):
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.05
+                self.cond.wait(max(wait, 0.005))
+
+    def release(self, status_code=None, latency=None, retry_after=None):
+        with self.cond:
+            self.in_flight -= 1
+            if status_code == 429:
+                self._decrease()
+                pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+                logger.warning(f'rate limited on {self.name}, pausing {pause:.1f}s '
+                               f'(rate={self.rate:.1f}/s, concurrency={self.concurrency:.1f})')
+            elif status_code is not None and status_code < 500 and latency is not None:
+                if self.best_latency is None or latency < self.best_latency:
+                    self.best_latency = latency
+                if latency > self.best_latency * SLOW_LATENCY_FACTOR and latency > 0.5:
+                    self.concurrency = max(1.0, self.concurrency * 0.9)
+                else:
+                    self._increase()
+            self.cond.notify_all()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease < DECREASE_COOLDOWN:
+            return
+        self.last_decrease = now
+        self.concurrency = max(1.0, self.concurrency / 2)
+        self.rate = max(MIN_RPS, self.rate / 2)
+
+    def _increase(self):
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        self.rate = min(self.max_rate, self.rate + RPS_STEP)
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+def get_group(name=None):
+    name = name or 'default'
+    group = _groups.get(name)
+    if group is None:
+        with _groups_lock:
+            group = _groups.get(name)
+            if group is None:
+                rate, concurrency = GROUP_LIMITS.get(name, GROUP_LIMITS['default'])
+                group = _groups[name] = EndpointGroup(name, rate, concurrency)
+    return group
+
+# Retry-After is either delay seconds or an http date
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,54 +1,86 @@
 from api.auth_api import get_flip_access_token
-from api.orders_api import list_orders, get_order_details, approve_order
+from api.orders_api import iter_orders, get_order_details_many, execute_mutations
+from utils.policy_engine import compile_policy, log_report
+from utils import metrics, profiling
+from utils.log_setup import configure_logging, log_job_summary
 from dotenv import load_dotenv
+import time
 import logging
+import argparse
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FCC_STATES = ['pendingApproval']
+
+FCC_POLICY = {
+    'name': 'fcc_approval',
+    'action': 'approve',
+    'states': FCC_STATES,
+    # list rows that already show another payment method never need their details
+    'prefilter': [
+        {'field': 'paymentMethodCode', 'op': 'eq', 'value': 'credits'},
+    ],
+    'order': [
+        {'field': 'paymentMethodCode', 'op': 'eq', 'value': 'credits'},
+        {'field': 'state', 'op': 'eq', 'value': 'pendingApproval'},
+    ]
+}
+fcc_policy = compile_policy(FCC_POLICY)
+
+# credit orders sitting in pending approval get approved. returns the action for the order, if any
+def check_fcc_order(order_id, order):
+    if fcc_policy.evaluate(order):
+        return 'approve'
+
+    logger.debug('Skipping order: %s / %s pmc=%r, state=%r', order.orderID, order_id, order.paymentMethodCode, order.state)
+    return None
+
 def approve_fcc_orders():
+    started = time.monotonic()
     token = get_flip_access_token()
     if not token:
         logger.error('could not obtain access-token')
         exit(1)
 
-    order_data = list_orders(token, page=1, limit=500, states=['pendingApproval']) # 1. get latest pending approval orders
-    orders = order_data.get('data', []) # 2. get just the {data}
+    orders = list(iter_orders(token, states=FCC_STATES)) # 1-2. get every page of pending approval orders
 
+    listed = len(orders)
+    logger.info(f'found {listed} pending approval order ids')
+    orders = [order for order in orders if fcc_policy.prefilter(order)]
     order_ids = [oid['id'] for oid in orders] # 3. get just the order IDs
-    logger.info(f'found {len(order_ids)} pending approval order ids')
+    logger.info(f'{len(order_ids)} orders left after the list prefilter')
 
     #4. fetch order dtails for each order
-    order_details_list = []
-    for order_id in order_ids:
-        try:
-            order_detail = get_order_details(token, order_id)
-            order_details_list.append(order_detail)
-            logger.info(f'fetched details for order {order_id}')
-        except Exception as e:
-            logger.exception(f'failed to fetch details for order {order_id}')
+    order_details_list = get_order_details_many(token, orders)
 
     # 5. check payment method and approve credit orders
-    for order_id, detail in zip(order_ids, order_details_list):
-        order_obj = detail.get('order', {})
-        flip_order_id = order_obj.get('orderID')
-        pmc = order_obj.get('paymentMethodCode')
-        order_state = order_obj.get('state')
-        
-        if pmc == "credits" and order_state == "pendingApproval":
-            success, _ = approve_order(token, order_id)
-            if success:
-                logger.info(
-                    f"Approved {flip_order_id} / {order_id} "
-                    f"pmc={pmc}, state={order_state}"
-                )
-        else:
-            logger.info(
-                f"Skipping order: {flip_order_id} / {order_id} "
-                f"pmc={pmc!r}, state={order_state!r}"
-            )
+    approvals = []
+    updated_at = {}
+    for order_id, order in zip(order_ids, order_details_list):
+        if order is None:
+            continue
+        action = check_fcc_order(order_id, order)
+        if action:
+            approvals.append((action, order_id))
+            updated_at[order_id] = order.updatedAt
+    summary = execute_mutations(token, approvals, updated_at=updated_at)
+    for _, order_id in summary['succeeded']:
+        logger.info(f"Approved {order_id}")
+
+    log_report(fcc_policy)
+    log_job_summary(
+        'approve_fcc_orders', started, listed=listed, fetched=sum(order is not None for order in order_details_list),
+        matched=len(approvals), acted=len(summary['succeeded']), already_done=len(summary['skipped']),
+        failed=len(summary['failed']) + order_details_list.count(None)
+    )
 
 if __name__ == "__main__":
-    approve_fcc_orders()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description='approve credit orders waiting in pending approval')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    args = parser.parse_args()
+
+    with metrics.job('approve_fcc_orders'), profiling.profiled('approve_fcc_orders', args.profile):
+        approve_fcc_orders()
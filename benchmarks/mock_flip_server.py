@@ -0,0 +1,334 @@
+import re
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from utils.log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# a local stand-in for the Flip endpoints the scripts call, serving synthetic
+# orders and brands. every endpoint group gets its own latency, error and 429 rate
+
+REFRESH_PATH = '/benchmark/auth/refresh'
+DISABLE_SKUS_PATH = '/benchmark/items/disable'
+
+ORDER_STATE_WEIGHTS = {
+    'pendingApproval': 25, 'stylistApproval': 25, 'new': 10, 'inStyling': 5, 'readyToShip': 10,
+    'pendingPick': 5, 'OPS': 5, 'paymentInReview': 5, 'shipped': 5, 'completed': 5,
+}
+KEYWORD_DESCRIPTIONS = [
+    'Green Tea Extract Capsules', 'Whey Protein Isolate', 'Raspberry Ketone Complex',
+    'Garcinia Cambogia Drops', 'Creatine Monohydrate', 'Green Coffee Bean Extract',
+]
+PLAIN_DESCRIPTIONS = [
+    'Knit Beanie', 'Vitamin D3 Gummies', 'Collagen Face Cream', 'Teacup Set', 'Protein Bar Box',
+    'Linen Shirt', 'Magnesium Glycinate', 'Wool Socks', 'Fish Oil Softgels', 'Extracurricular Notebook',
+]
+CATEGORIES = ['Vitamins & Supplements', 'Beauty', 'Apparel', 'Home']
+ENDPOINT_GROUPS = ('list', 'detail', 'mutation', 'brand', 'auth', 'catalog')
+
+# per endpoint group: mean latency in ms, share of 5xx responses, share of 429s
+DEFAULT_ENDPOINT_CONFIG = {group: {'latency_ms': 20.0, 'error_rate': 0.0, 'rate_429': 0.0} for group in ENDPOINT_GROUPS}
+DEFAULT_ENDPOINT_CONFIG['list']['latency_ms'] = 80.0
+
+class SyntheticData:
+    def __init__(self, orders=1000, brands=500, seed=1, rich_list_rows=False, banned_device_share=0.01):
+        self.seed = seed
+        self.rich_list_rows = rich_list_rows
+        self.lock = threading.Lock()
+        rng = random.Random(seed)
+        states = list(ORDER_STATE_WEIGHTS)
+        weights = list(ORDER_STATE_WEIGHTS.values())
+        # only the fields that drive listing are kept per order, details are rebuilt from the seed
+        self.states = rng.choices(states, weights=weights, k=orders)
+        self.updated_at = [1700000000000 + i for i in range(orders)]
+        self.device_count = max(orders // 4, 1)
+        self.banned_device_ids = {f'device-{i}' for i in rng.sample(range(self.device_count), max(int(self.device_count * banned_device_share), 1))}
+        self.brands = [
+            {'id': f'brand-{i}', 'name': f'Benchmark Brand {i}', 'createdAt': f'2024-01-01T00:00:{i:06d}Z',
+             'operationData': {'orderReturnDCAddress': {'city': 'Commerce', 'street': '6098 Rickenbacker Road', 'postalCode': '90040'}}}
+            for i in range(brands)
+        ]
+        self._listings = {}
+
+    def __len__(self):
+        return len(self.states)
+
+    def _order_rng(self, index):
+        return random.Random(self.seed * 1000003 + index)
+
+    def _summary(self, index):
+        row = {'id': f'order-{index}', 'orderID': f'F{index:08d}', 'state': self.states[index], 'updatedAt': self.updated_at[index]}
+        if self.rich_list_rows:
+            order = self.detail(index)['order']
+            for field in ('paymentMethodCode', 'tag', 'shippingAddress', 'customer'):
+                row[field] = order[field]
+        return row
+
+    def detail(self, index):
+        rng = self._order_rng(index)
+        items = []
+        for _ in range(rng.randint(1, 4)):
+            item_number = rng.randrange(2000)
+            descriptions = KEYWORD_DESCRIPTIONS if item_number % 10 == 0 else PLAIN_DESCRIPTIONS
+            description = descriptions[item_number % len(descriptions)]
+            items.append({'item': {
+                'id': f'item-{item_number}', 'sku': f'SKU{item_number:06d}',
+                'category': CATEGORIES[item_number % len(CATEGORIES)],
+                'description': description,
+                'long_description': f'{description}. ' + 'Sourced and packed with care for everyday use. ' * 6,
+            }})
+        return {'order': {
+            'id': f'order-{index}',
+            'orderID': f'F{index:08d}',
+            'state': self.states[index],
+            'updatedAt': self.updated_at[index],
+            'tag': 'test' if rng.random() < 0.02 else None,
+            'paymentMethodCode': 'credits' if rng.random() < 0.3 else 'card',
+            'deviceId': f'device-{rng.randrange(self.device_count)}',
+            'shippingAddress': {'state': 'New York' if rng.random() < 0.2 else 'California'},
+            'customer': {'orderStatus': 'active'},
+            'items': items,
+        }}
+
+    def list_page(self, states, page, limit):
+        key = tuple(sorted(states))
+        with self.lock:
+            listing = self._listings.get(key)
+            if listing is None:
+                wanted = set(states)
+                listing = [i for i, state in enumerate(self.states) if state in wanted]
+                self._listings[key] = listing
+            window = listing[(page - 1) * limit:page * limit]
+        return [self._summary(i) for i in window]
+
+    def set_state(self, index, state):
+        with self.lock:
+            self.states[index] = state
+            self.updated_at[index] += 1
+            self._listings.clear()
+
+class MockFlipServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data, endpoint_config=None, seed=1):
+        super().__init__(address, MockFlipHandler)
+        self.data = data
+        self.endpoint_config = {group: dict(config) for group, config in DEFAULT_ENDPOINT_CONFIG.items()}
+        for group, config in (endpoint_config or {}).items():
+            self.endpoint_config[group].update(config)
+        self.rng = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {group: {'requests': 0, 'errors': 0, 'throttled': 0, 'bytes': 0} for group in ENDPOINT_GROUPS}
+
+    def snapshot_stats(self):
+        with self.stats_lock:
+            return {group: dict(counts) for group, counts in self.stats.items()}
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+class MockFlipHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, group, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.server.stats_lock:
+            counts = self.server.stats[group]
+            counts['requests'] += 1
+            counts['bytes'] += len(payload)
+            counts['errors'] += 500 <= status
+            counts['throttled'] += status == 429
+
+    # latency, then an injected 429 or 5xx; returns True when the request was answered here
+    def _inject(self, group):
+        config = self.server.endpoint_config[group]
+        with self.server.stats_lock:
+            jitter = self.server.rng.uniform(0.5, 1.5)
+            roll = self.server.rng.random()
+        time.sleep(config['latency_ms'] * jitter / 1000)
+        if roll < config['rate_429']:
+            self._send(group, 429, {'message': 'too many requests'}, {'Retry-After': '1'})
+            return True
+        if roll < config['rate_429'] + config['error_rate']:
+            self._send(group, 503, {'message': 'injected failure'})
+            return True
+        return False
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _order_index(self, order_id):
+        match = re.fullmatch(r'order-(\d+)', order_id)
+        if match and int(match.group(1)) < len(self.server.data):
+            return int(match.group(1))
+        return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        data = self.server.data
+        if url.path == '/api/v2/order/list':
+            if self._inject('list'):
+                return
+            query = parse_qs(url.query)
+            states = (query.get('state') or [''])[0].split(',')
+            page = int((query.get('page') or ['1'])[0])
+            limit = int((query.get('limit') or ['100'])[0])
+            return self._send('list', 200, {'data': data.list_page(states, page, limit)})
+
+        match = re.fullmatch(r'/api/order/([^/]+)', url.path)
+        if match:
+            if self._inject('detail'):
+                return
+            index = self._order_index(match.group(1))
+            if index is None:
+                return self._send('detail', 404, {'message': 'order not found'})
+            return self._send('detail', 200, data.detail(index))
+
+        self._send('detail', 404, {'message': 'unknown path'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._body()
+        data = self.server.data
+
+        if url.path == REFRESH_PATH:
+            if self._inject('auth'):
+                return
+            expires_at = int(time.time() * 1000) + 3600 * 1000
+            return self._send('auth', 200, {'data': {'auth': {'accessToken': 'benchmark-token', 'expiresAt': expires_at}}})
+
+        match = re.fullmatch(r'/shop/admin/orders/([^/]+)/(cancel/v1|accept-order-in-pending-approval-state/v1)', url.path)
+        if match:
+            if self._inject('mutation'):
+                return
+            index = self._order_index(match.group(1))
+            if index is None:
+                return self._send('mutation', 404, {'message': 'order not found'})
+            if match.group(2) == 'cancel/v1':
+                data.set_state(index, 'cancelled')
+                return self._send('mutation', 200, {'data': {'result': 'success'}})
+            data.set_state(index, 'readyToShip')
+            return self._send('mutation', 200, {'success': True})
+
+        if url.path.startswith('/shop/admin/brands/') or url.path.startswith('/shop/brands/'):
+            if self._inject('brand'):
+                return
+            if url.path.endswith('/list/v2'):
+                brands = sorted(data.brands, key=lambda brand: brand['createdAt'], reverse=True)
+                if body.get('name'):
+                    brands = [brand for brand in brands if body['name'].lower() in brand['name'].lower()]
+                page, limit = int(body.get('page', 1)), int(body.get('limit', 10))
+                return self._send('brand', 200, {'data': brands[(page - 1) * limit:page * limit]})
+            if url.path.endswith('/outbound/v1'):
+                with data.lock:
+                    brand = {'id': f'brand-{len(data.brands)}', 'name': body.get('name'),
+                             'createdAt': f'2024-01-01T00:00:{len(data.brands):06d}Z', 'operationData': {}}
+                    data.brands.append(brand)
+                return self._send('brand', 200, {'data': brand})
+            return self._send('brand', 200, {'success': True})
+
+        self._send('detail', 404, {'message': 'unknown path'})
+
+    def do_PATCH(self):
+        url = urlparse(self.path)
+        body = self._body()
+        if url.path == '/shop/admin/brands/onboarding/update/v1':
+            if self._inject('brand'):
+                return
+            data = self.server.data
+            with data.lock:
+                for brand in data.brands:
+                    if brand['id'] == body.get('id'):
+                        brand.setdefault('operationData', {}).update(body.get('operationData') or {})
+            return self._send('brand', 200, {'success': True})
+        self._send('brand', 404, {'message': 'unknown path'})
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        body = self._body()
+        if url.path == DISABLE_SKUS_PATH:
+            if self._inject('catalog'):
+                return
+            return self._send('catalog', 200, {'disabled': len(body.get('skus') or [])})
+        self._send('catalog', 404, {'message': 'unknown path'})
+
+# "detail=20" / "detail=20:0.01:0.05" -> {'detail': {'latency_ms': 20, 'error_rate': 0.01, 'rate_429': 0.05}}
+def parse_endpoint_config(values):
+    config = {}
+    for value in values or []:
+        group, _, settings = value.partition('=')
+        if group not in ENDPOINT_GROUPS:
+            raise ValueError(f'unknown endpoint group {group!r}, expected one of {ENDPOINT_GROUPS}')
+        parts = settings.split(':')
+        config[group] = {'latency_ms': float(parts[0])}
+        if len(parts) > 1:
+            config[group]['error_rate'] = float(parts[1])
+        if len(parts) > 2:
+            config[group]['rate_429'] = float(parts[2])
+    return config
+
+# the environment that points the scripts at a running mock
+def client_env(server):
+    return {
+        'FLIP_BASE_URL': server.base_url,
+        'REFRESH_TOKEN': 'benchmark',
+        'REFRESH_TOKEN_PATH': REFRESH_PATH,
+        'FLIP_DISABLE_SKUS_PATH': DISABLE_SKUS_PATH,
+    }
+
+def main():
+    configure_logging(log_file=None, console=True)
+    parser = argparse.ArgumentParser(description='serve a synthetic Flip API for local runs')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--brands', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rich-list-rows', action='store_true', help='include payment/shipping fields in list rows')
+    parser.add_argument('--endpoint', action='append', help='GROUP=LATENCY_MS[:ERROR_RATE[:RATE_429]]')
+    args = parser.parse_args()
+
+    data = SyntheticData(args.orders, args.brands, args.seed, args.rich_list_rows)
+    server = MockFlipServer(('127.0.0.1', args.port), data, parse_endpoint_config(args.endpoint), args.seed)
+    for name, value in client_env(server).items():
+        print(f'export {name}={value}')
+    logger.info(f'serving {args.orders} synthetic orders on {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+from utils.log_setup import configure_logging
+from benchmarks.mock_flip_server import SyntheticData, MockFlipServer, parse_endpoint_config, client_env
+
+logger = logging.getLogger(__name__)
+
+# job name -> (module, function). each job runs in its own process so peak RSS is its own
+JOBS = {
+    'fcc': ('approve_fcc_orders', 'approve_fcc_orders'),
+    'nyc': ('cancel_nyc_orders', 'cancel_nyc_banned_ingredients'),
+    'banned': ('cancel_banned_device_orders', 'cancel_banned_device_id_orders'),
+    'sweep': ('main', 'main'),
+}
+# jobs that read the banned device sheet get a fresh local snapshot instead
+SHEET_JOBS = {'banned', 'sweep'}
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# runs inside the child process and prints one json line for the parent
+def run_child(job):
+    configure_logging(level=os.getenv('BENCHMARK_LOG_LEVEL', 'INFO'))
+    module_name, function_name = JOBS[job]
+    module = __import__(module_name)
+    status = 'ok'
+    start = time.perf_counter()
+    try:
+        getattr(module, function_name)()
+    except SystemExit as e:
+        status = f'exit {e.code}'
+    except Exception as e:
+        status = f'error {type(e).__name__}: {e}'
+    wall = time.perf_counter() - start
+    print(json.dumps({'wall': wall, 'peak_rss': _peak_rss_bytes(), 'status': status}))
+
+def _seed_banned_device_snapshot(state_dir, banned_device_ids):
+    with open(os.path.join(state_dir, 'banned_device_ids.json'), 'w') as f:
+        json.dump({
+            'spreadsheet_id': 'benchmark',
+            'modified_time': None,
+            'checked_at': time.time(),
+            'device_ids': sorted(banned_device_ids)
+        }, f)
+
+def run_job(job, orders, args):
+    data = SyntheticData(orders, seed=args.seed, rich_list_rows=args.rich_list_rows)
+    server = MockFlipServer(('127.0.0.1', 0), data, parse_endpoint_config(args.endpoint), args.seed)
+    server.start()
+    state_dir = tempfile.mkdtemp(prefix=f'flip-bench-{job}-')
+    try:
+        if job in SHEET_JOBS:
+            _seed_banned_device_snapshot(state_dir, data.banned_device_ids)
+        # job logs go through the normal rotating file handler, kept out of the repo's logs/
+        env = dict(os.environ, STATE_DIR=state_dir, LOG_FILE=os.path.join(state_dir, 'job.log'), **client_env(server))
+        for override in args.env or []:
+            name, _, value = override.partition('=')
+            env[name] = value
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run_benchmarks', '--child', job],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0 or not completed.stdout.strip():
+            logger.error(f'{job} at {orders} orders crashed:\n{completed.stderr[-2000:]}')
+            return None
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    stats = server.snapshot_stats()
+    requests_sent = sum(counts['requests'] for counts in stats.values())
+    result.update({
+        'job': job,
+        'orders': orders,
+        'requests': requests_sent,
+        'requests_per_second': requests_sent / result['wall'] if result['wall'] else 0.0,
+        'endpoints': stats,
+    })
+    return result
+
+def log_result(result):
+    endpoints = ', '.join(
+        f"{group}={counts['requests']}" + (f" ({counts['errors']} err, {counts['throttled']} 429)" if counts['errors'] or counts['throttled'] else '')
+        for group, counts in result['endpoints'].items() if counts['requests']
+    )
+    logger.info(
+        f"{result['job']:>7} {result['orders']:>7} orders: {result['wall']:8.2f}s wall, "
+        f"{result['requests_per_second']:8.1f} req/s, peak rss {result['peak_rss'] / 2**20:7.1f} MiB, "
+        f"{result['status']} [{endpoints}]"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='time the order jobs against a local mock Flip API')
+    parser.add_argument('--orders', default='1000', help='comma separated order counts, e.g. 1000,10000,50000')
+    parser.add_argument('--jobs', default=','.join(JOBS), help=f'comma separated subset of {sorted(JOBS)}')
+    parser.add_argument('--endpoint', action='append', help='GROUP=LATENCY_MS[:ERROR_RATE[:RATE_429]], repeatable')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rich-list-rows', action='store_true', help='include payment/shipping fields in list rows')
+    parser.add_argument('--env', action='append', help='NAME=VALUE passed to the job process, e.g. RATE_DETAIL_RPS=100')
+    parser.add_argument('--output', help='write all results to this json file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    configure_logging(log_file=None, console=True)
+    results = []
+    for orders in (int(value) for value in args.orders.split(',')):
+        for job in args.jobs.split(','):
+            result = run_job(job, orders, args)
+            if result is not None:
+                log_result(result)
+                results.append(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
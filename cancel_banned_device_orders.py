@@ -1,50 +1,87 @@
 from api.auth_api import get_flip_access_token
-from api.orders_api import list_orders, get_order_details, cancel_order
+from api.orders_api import iter_orders, get_order_details_many, execute_mutations, OPEN_ORDER_STATES
 from utils.gsheet_utils import get_banned_device_ids
+from utils.policy_engine import compile_policy
+from utils import order_index, metrics, profiling
+from utils.log_setup import configure_logging, log_job_summary
 from dotenv import load_dotenv
+import time
 import logging
+import argparse
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BANNED_DEVICE_STATES = OPEN_ORDER_STATES
+
+BANNED_DEVICE_POLICY = {
+    'name': 'banned_devices',
+    'action': 'cancel',
+    'states': BANNED_DEVICE_STATES,
+    'order': [
+        {'field': 'deviceId', 'op': 'in', 'value': {'param': 'banned_device_ids'}, 'normalize': 'lower'},
+    ]
+}
+
+# normalized (stripped, lowercased) ids from the local block list snapshot
+def load_banned_device_ids():
+    return get_banned_device_ids()
+
+# the block list changes, so the policy is compiled against each loaded copy
+def compile_banned_device_policy(banned_device_ids):
+    return compile_policy(BANNED_DEVICE_POLICY, params={'banned_device_ids': banned_device_ids})
+
+# orders placed from a banned device get cancelled. returns the action for the order, if any
+def check_banned_device_order(order_id, order, policy):
+    if policy.evaluate(order):
+        device_id = (order.deviceId or '').strip().lower()
+        logger.info(f'found device id: {device_id} from order {order.orderID} / {order_id}')
+        return 'cancel'
+    return None
+
+# open orders placed from banned devices, answered from the local order index
+def find_banned_device_orders(banned_device_ids):
+    return order_index.find_orders_by_device(banned_device_ids, BANNED_DEVICE_STATES)
+
 def cancel_banned_device_id_orders():
+    started = time.monotonic()
     token = get_flip_access_token()
     if not token:
         logger.error('could not obtain access token')
         exit(1)
 
-    orders_list = list_orders(token, page=1, limit=1000)
-    orders_data = orders_list.get('data', [])
+    # list rows are cheap, walk every open order so the index knows their current state
+    orders_data = list(iter_orders(token, states=BANNED_DEVICE_STATES))
 
     order_ids = [oid['id'] for oid in orders_data]
     logger.info(f'found {len(order_ids)} order ids')
+    order_index.forget_unlisted(BANNED_DEVICE_STATES, set(order_ids))
 
-    order_details_list = []
-    raw_banned_device_id_list = get_banned_device_ids()
-    lower_banned_device_id_list = {device.strip().lower() for device in raw_banned_device_id_list}
-    if not lower_banned_device_id_list:
+    banned_device_ids = load_banned_device_ids()
+    if not banned_device_ids:
          logger.error(f'failed to fetch banned device id list')
          exit(1)
 
-    for order_id in order_ids:
-        try:
-            order_details = get_order_details(token, order_id)
-            order_details_list.append(order_details)
-            logger.info(f'fetched details for order: {order_id}')
-        except Exception as e:
-            logger.exception(f'failed to fetch details for order: {order_id}')
-            continue
-
-    for order_id, detail in zip(order_ids, order_details_list):
-            order_obj = detail.get('order', {})
-            order_flip_id = order_obj.get('orderID')
-            device_id = order_obj.get('deviceId', '').strip().lower()
-
-            if device_id in lower_banned_device_id_list:
-                 logger.info(f'found device id: {device_id} from order {order_flip_id} / {order_id}')
-                 cancelled_order = cancel_order(token, order_id)
-                 if cancelled_order:
-                    logger.info(f'successfully cancelled order {order_flip_id} / {order_id}')
+    # device ids never change, so only orders the index hasn't seen need a detail fetch
+    unindexed = set(order_index.missing_details(order_ids))
+    logger.info(f'fetching details for {len(unindexed)} unindexed orders')
+    details = get_order_details_many(token, [order for order in orders_data if order['id'] in unindexed])
+
+    matches = find_banned_device_orders(banned_device_ids)
+    logger.info(f'found {len(matches)} open orders from banned devices')
+    for order_id, order_flip_id, device_id in matches:
+        logger.info(f'found device id: {device_id} from order {order_flip_id} / {order_id}')
+    summary = execute_mutations(token, [('cancel', order_id) for order_id, _, _ in matches])
+    log_job_summary(
+        'cancel_banned_device_orders', started, listed=len(order_ids), fetched=sum(detail is not None for detail in details),
+        matched=len(matches), acted=len(summary['succeeded']), already_done=len(summary['skipped']),
+        failed=len(summary['failed']) + details.count(None)
+    )
 
 if __name__ == '__main__':
-     cancel_banned_device_id_orders()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description='cancel open orders placed from banned devices')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    args = parser.parse_args()
+
+    with metrics.job('cancel_banned_device_orders'), profiling.profiled('cancel_banned_device_orders', args.profile):
+        cancel_banned_device_id_orders()
@@ -1,69 +1,91 @@
 from api.auth_api import get_flip_access_token
-from api.orders_api import list_orders, get_order_details, cancel_order
+from api.orders_api import iter_orders, get_order_details_many, execute_mutations
+from utils.policy_engine import compile_policy, log_report
+from utils import metrics, profiling
+from utils.log_setup import configure_logging, log_job_summary
 from dotenv import load_dotenv
+import time
 import logging
+import argparse
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 KEYWORDS = {
     "creatine","green","tea","raspberry","ketone","garcinia",
     "cambogia","coffee","bean","extract","whey","protein","muscular"
 }
+NYC_STATES = ['stylistApproval']
+
+NYC_POLICY = {
+    'name': 'nyc_ingredients',
+    'action': 'cancel',
+    'states': NYC_STATES,
+    # the same order checks on raw list-row fields, to skip detail calls for orders shipping elsewhere
+    'prefilter': [
+        {'field': 'tag', 'op': 'not_in', 'value': {"payment-in-review", "test"}},
+        {'field': 'shippingAddress.state', 'op': 'eq', 'value': "New York"},
+        {'field': 'customer.orderStatus', 'op': 'ne', 'value': "cancelled"},
+    ],
+    'order': [
+        {'field': 'state', 'op': 'in', 'value': {"OOSItem", "giftPending", "stylistApproval", "readyToShip"}},
+        {'field': 'tag', 'op': 'not_in', 'value': {"payment-in-review", "test"}},
+        {'field': 'shipping_state', 'op': 'eq', 'value': "New York"},
+        {'field': 'customer_status', 'op': 'ne', 'value': "cancelled"},
+    ],
+    'item_key': None,
+    'items': [
+        {'field': 'category', 'op': 'eq', 'value': "Vitamins & Supplements"},
+        {'fields': ['description', 'long_description'], 'op': 'keywords', 'value': KEYWORDS},
+    ]
+}
+nyc_policy = compile_policy(NYC_POLICY)
+
+# NY orders containing supplements with banned ingredients get cancelled. returns the action for the order, if any
+def check_nyc_order(order_id, order):
+    if nyc_policy.evaluate(order):
+        logger.info(f'cancelling order {order.orderID} / {order_id}')
+        return 'cancel'
+    return None
 
 def cancel_nyc_banned_ingredients():
+    started = time.monotonic()
     token = get_flip_access_token()
     if not token:
         logger.error('could not obtain access token')
         exit(1)
 
-    order_data = list_orders(token, page=1, limit=500, states=['stylistApproval'])
-    orders = order_data.get('data', [])
+    orders = list(iter_orders(token, states=NYC_STATES))
+    listed = len(orders)
+    orders = [order for order in orders if nyc_policy.prefilter(order)]
     order_ids = [oid['id'] for oid in orders]
-    
-    order_details_list = []
-    for order_id in order_ids:
-        order_detail = get_order_details(token, order_id)
-        order_details_list.append(order_detail)
-        logger.info(f'fetched details for order: {order_id}')
 
-    for order_id, detail in zip(order_ids, order_details_list):
-        order = detail.get("order", {})
-        
-        # top‐level order fields
-        order_flip_id   = order.get("orderID")
-        order_state     = order.get("state")
-        order_tag       = order.get("tag")
+    order_details_list = get_order_details_many(token, orders)
 
-        # customer level fields
-        customer_obj    = order.get('customer')
-        order_status    = customer_obj.get("orderStatus")
+    cancellations = []
+    updated_at = {}
+    for order_id, order in zip(order_ids, order_details_list):
+        if order is None:
+            continue
+        action = check_nyc_order(order_id, order)
+        if action:
+            cancellations.append((action, order_id))
+            updated_at[order_id] = order.updatedAt
+    summary = execute_mutations(token, cancellations, updated_at=updated_at)
 
-        # shipping address state
-        shipping_state  = order.get("shippingAddress", {}).get("state")
-
-        # order items
-        for line in order.get("items", []):
-            item_data           = line.get("item", {})
-            item_category       = item_data.get("category")
-            item_title          = item_data.get("description")
-            title_lower         = item_title.lower()
-            item_long_desc      = item_data.get("long_description", "")
-            desc_lower          = item_long_desc.lower()
-            
-            if (
-                order_state in {"OOSItem", "giftPending", "stylistApproval", "readyToShip"}
-                and order_tag not in {"payment-in-review", "test"}
-                and shipping_state == "New York"
-                and item_category == "Vitamins & Supplements"
-                and order_status != "cancelled"
-                and any((keyword in desc_lower) or (keyword in title_lower) for keyword in KEYWORDS)
-            ):
-                logger.info(f'cancelling order {order_flip_id} / {order_id}')
-                cancel_order(token, order_id)
-                break
+    log_report(nyc_policy)
+    log_job_summary(
+        'cancel_nyc_orders', started, listed=listed, fetched=sum(order is not None for order in order_details_list),
+        matched=len(cancellations), acted=len(summary['succeeded']), already_done=len(summary['skipped']),
+        failed=len(summary['failed']) + order_details_list.count(None)
+    )
 
 if __name__ == "__main__":
-    cancel_nyc_banned_ingredients()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description='cancel NY supplement orders with banned ingredients')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    args = parser.parse_args()
+
+    with metrics.job('cancel_nyc_orders'), profiling.profiled('cancel_nyc_orders', args.profile):
+        cancel_nyc_banned_ingredients()
@@ -1,22 +1,71 @@
+import csv
 import logging
+import argparse
 from dotenv import load_dotenv
 from api.auth_api import get_flip_access_token
-from api.items_api import disable_sku
+from api.items_api import disable_skus
+from utils.gsheet_utils import get_sheet_column
+from utils import metrics, profiling
+from utils.log_setup import configure_logging
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-if __name__ == "__main__":
-    
+# the "sku" column of a csv, or its first column when there is no such header
+def load_skus_from_csv(path):
+    with open(path, newline='') as f:
+        rows = [row for row in csv.reader(f) if row]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'sku' in header:
+        column = header.index('sku')
+        rows = rows[1:]
+    else:
+        column = 0
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+def write_report(path, outcomes):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sku', 'disabled', 'error'])
+        for sku, (success, detail) in outcomes.items():
+            writer.writerow([sku, success, detail or ''])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='disable skus in bulk')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='csv with a "sku" column (or skus in the first column)')
+    source.add_argument('--sheet', help='google sheet holding the skus')
+    parser.add_argument('--worksheet', default='Sheet1')
+    parser.add_argument('--column', type=int, default=1)
+    parser.add_argument('--audit-status', default='connectivity')
+    parser.add_argument('--report', help='write per-sku outcomes to this csv')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    return parser.parse_args()
+
+def main(args):
     token = get_flip_access_token()
     if not token:
         logger.error('could not obtain access token')
+        exit(1)
 
-    skus_to_disable = [
-        "350380805BRO1V1",
-        "400346909BLA1V1",
-    ]
-    
-    disable_sku(token, skus_to_disable)
\ No newline at end of file
+    if args.csv:
+        skus_to_disable = load_skus_from_csv(args.csv)
+    else:
+        skus_to_disable = get_sheet_column(args.sheet, args.worksheet, args.column)
+
+    outcomes = disable_skus(skus_to_disable, token, args.audit_status)
+    failed = [sku for sku, (success, _) in outcomes.items() if not success]
+    logger.info(f'disabled {len(outcomes) - len(failed)} of {len(outcomes)} skus')
+    for sku in failed:
+        logger.error(f'could not disable sku {sku}: {outcomes[sku][1]}')
+    if args.report:
+        write_report(args.report, outcomes)
+
+if __name__ == "__main__":
+    configure_logging()
+    args = parse_args()
+    with metrics.job('disable_skus'), profiling.profiled('disable_skus', args.profile):
+        main(args)
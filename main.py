@@ -1,9 +1,254 @@
-from approve_fcc_orders import approve_fcc_orders
-from cancel_nyc_orders import cancel_nyc_banned_ingredients
+import os
+import time
+import signal
+import random
+import logging
+import argparse
+import threading
+from functools import partial
+from api.auth_api import get_flip_access_token
+from api.orders_api import iter_orders, get_order_details_many, execute_mutations
+from approve_fcc_orders import fcc_policy, check_fcc_order
+from cancel_nyc_orders import nyc_policy, check_nyc_order
+from cancel_banned_device_orders import (
+    compile_banned_device_policy, check_banned_device_order, load_banned_device_ids, find_banned_device_orders
+)
+from utils import order_ledger, metrics, profiling
+from utils.policy_engine import log_report
+from utils.log_setup import configure_logging, log_job_summary
+
+logger = logging.getLogger(__name__)
+
+# verdict recorded once a policy's action has gone through
+ACTION_VERDICTS = {'cancel': 'cancelled', 'approve': 'approved'}
+
+# daemon mode: seconds between runs of each policy's sweep
+POLICY_INTERVALS = {
+    'fcc_approval': int(os.getenv('FCC_APPROVAL_INTERVAL', '60')),
+    'nyc_ingredients': int(os.getenv('NYC_INGREDIENTS_INTERVAL', '120')),
+    'banned_devices': int(os.getenv('BANNED_DEVICES_INTERVAL', '900')),
+}
+INTERVAL_JITTER = float(os.getenv('INTERVAL_JITTER', '0.1')) # +/- fraction of the interval
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0')) # daemon mode: serve /metrics on this port when set
+
+def load_banned_device_ids_safe():
+    try:
+        return load_banned_device_ids()
+    except Exception:
+        logger.exception('failed to fetch banned device id list')
+        return None
+
+def _registered(policy, check, **extra):
+    registered = {
+        'name': policy.name,
+        'states': policy.states,
+        'check': check,
+        'version': policy.version,
+        'rules': policy
+    }
+    registered.update(extra)
+    return registered
+
+# cancellations run before approvals so a banned order is never approved first
+def build_policies(banned_device_ids):
+    policies = []
+
+    if banned_device_ids:
+        banned_device_policy = compile_banned_device_policy(banned_device_ids)
+        # a block list change doesn't invalidate the ledger; orders from newly banned
+        # devices are found through the order index and re-evaluated instead
+        policies.append(_registered(
+            banned_device_policy,
+            partial(check_banned_device_order, policy=banned_device_policy),
+            version=banned_device_policy.spec_version,
+            candidates=partial(find_banned_device_orders, banned_device_ids)
+        ))
+    else:
+        logger.error('banned device id list is empty, skipping banned device policy')
+
+    policies.append(_registered(nyc_policy, check_nyc_order))
+    policies.append(_registered(fcc_policy, check_fcc_order))
+    return policies
+
+# the policy's action for the order (or None), 'error' if the check itself blew up
+def _check_policy(policy, order_id, order):
+    try:
+        return policy['check'](order_id, order)
+    except Exception:
+        logger.exception(f'policy {policy["name"]} failed on order {order_id}')
+        return 'error'
+
+# run the due policies over one projected order. the first policy to ask for an
+# action owns the order and later ones don't see it. returns ((policy, action) or
+# None, [(policy, 'skipped' or 'error'), ...] for the policies that passed on it)
+def judge_order(due, order_id, order_view):
+    passed = []
+    for policy in due:
+        if order_view.state not in policy['states']:
+            continue
+        action = _check_policy(policy, order_id, order_view)
+        if action == 'error':
+            passed.append((policy, 'error'))
+        elif action:
+            return (policy, action), passed
+        else:
+            passed.append((policy, 'skipped'))
+    return None, passed
+
+# list the union of every active policy's states once, fetch each order's details
+# once and hand the projected order to every policy that covers its state. the
+# resulting cancels/approvals are sent as one journaled batch. orders the ledger
+# shows as already judged at the same updatedAt/state are skipped entirely.
+# passive policies don't widen the listing, they only see orders that were
+# fetched for an active one
+def sweep(policies):
+    started = time.monotonic()
+    token = get_flip_access_token()
+    if not token:
+        logger.error('could not obtain access token')
+        return None
+
+    active = [policy for policy in policies if not policy.get('passive')]
+    if not active:
+        return {}
+    states = sorted(set().union(*(policy['states'] for policy in active)))
+    orders = list(iter_orders(token, states=states))
+    logger.info(f'sweep found {len(orders)} orders across {len(states)} states')
+
+    entries = order_ledger.load_entries([order['id'] for order in orders])
+    forced = {
+        policy['name']: {match[0] for match in policy['candidates']()}
+        for policy in active if policy.get('candidates')
+    }
+
+    verdicts = {policy['name']: {} for policy in policies}
+    records = []
+
+    def tally(order, policy, verdict):
+        counts = verdicts[policy['name']]
+        counts[verdict] = counts.get(verdict, 0) + 1
+        # failures are left out of the ledger so they are retried next cycle
+        if verdict not in ('failed', 'error'):
+            records.append((order['id'], policy['name'], policy.get('version'), order.get('updatedAt'), order.get('state'), verdict))
+
+    pending = []
+    prefiltered = 0
+    for order in orders:
+        due = [
+            policy for policy in policies
+            if order.get('state') in policy['states'] and (
+                order['id'] in forced.get(policy['name'], ())
+                or not order_ledger.is_unchanged(entries, order, policy)
+            )
+        ]
+        # policies whose prefilter rejects the list row are settled without a detail fetch
+        survivors = []
+        for policy in due:
+            if policy['rules'].prefilter(order):
+                survivors.append(policy)
+            else:
+                tally(order, policy, 'prefiltered')
+        if any(not policy.get('passive') for policy in survivors):
+            pending.append((order, survivors))
+        elif any(not policy.get('passive') for policy in due):
+            prefiltered += 1
+    logger.info(
+        f'{len(pending)} new or changed orders to evaluate, {prefiltered} ruled out by list prefilters, '
+        f'{len(orders) - len(pending) - prefiltered} unchanged'
+    )
+
+    order_details_list = get_order_details_many(token, [order for order, _ in pending])
+
+    owners = {}
+    for (order, due), order_view in zip(pending, order_details_list):
+        if order_view is None:
+            continue
+        owner, passed = judge_order(due, order['id'], order_view)
+        for policy, verdict in passed:
+            tally(order, policy, verdict)
+        if owner:
+            policy, action = owner
+            owners[(action, order['id'])] = (order, policy)
+
+    summary = execute_mutations(
+        token, list(owners), updated_at={order_id: order.get('updatedAt') for (_, order_id), (order, _) in owners.items()}
+    )
+    for outcome in ('succeeded', 'skipped', 'failed'):
+        for action, order_id in summary[outcome]:
+            order, policy = owners[(action, order_id)]
+            tally(order, policy, 'failed' if outcome == 'failed' else ACTION_VERDICTS[action])
+
+    order_ledger.record(records)
+    order_ledger.prune()
+
+    for name, counts in verdicts.items():
+        logger.info(f'sweep policy {name}: {counts}')
+    for policy in policies:
+        log_report(policy['rules'])
+    log_job_summary(
+        'sweep', started, listed=len(orders), prefiltered=prefiltered,
+        fetched=sum(view is not None for view in order_details_list), matched=len(owners),
+        acted=len(summary['succeeded']), already_done=len(summary['skipped']),
+        failed=len(summary['failed']) + order_details_list.count(None),
+        policies=sorted(policy['name'] for policy in active), verdicts=verdicts
+    )
+    return verdicts
+
+def _jittered(interval):
+    return interval * (1 + random.uniform(-INTERVAL_JITTER, INTERVAL_JITTER))
+
+# stay resident and run each policy on its own interval. policies that come due
+# together share one sweep, and sweeps run one at a time so a job never overlaps
+# itself. session, token and caches stay warm between cycles
+def run_daemon():
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    next_run = {name: time.monotonic() for name in POLICY_INTERVALS}
+    banned_device_ids = None
+    logger.info(f'daemon started with intervals {POLICY_INTERVALS}')
+    if METRICS_PORT:
+        metrics.start_http_exporter(METRICS_PORT)
+
+    while not stop.is_set():
+        now = time.monotonic()
+        due = {name for name, at in next_run.items() if at <= now}
+        if not due:
+            stop.wait(min(next_run.values()) - now)
+            continue
+
+        try:
+            if 'banned_devices' in due or banned_device_ids is None:
+                banned_device_ids = load_banned_device_ids_safe() or banned_device_ids
+            policies = build_policies(banned_device_ids)
+            for policy in policies:
+                policy['passive'] = policy['name'] not in due
+            logger.info(f'running sweep for {sorted(due)}')
+            with metrics.job('sweep'):
+                sweep(policies)
+        except Exception:
+            logger.exception(f'sweep for {sorted(due)} failed')
+        finally:
+            for name in due:
+                next_run[name] = time.monotonic() + _jittered(POLICY_INTERVALS[name])
+
+    logger.info('daemon stopped')
 
 def main():
-    approve_fcc_orders()
-    cancel_nyc_banned_ingredients()
+    with metrics.job('sweep'):
+        if sweep(build_policies(load_banned_device_ids_safe())) is None:
+            exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description='run the order policies')
+    parser.add_argument('--daemon', action='store_true', help='stay resident and run each policy on its own interval')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    args = parser.parse_args()
+
+    with profiling.profiled('daemon' if args.daemon else 'sweep', args.profile):
+        if args.daemon:
+            run_daemon()
+        else:
+            main()
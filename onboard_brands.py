@@ -0,0 +1,233 @@
+import os
+import csv
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from api.auth_api import get_flip_access_token
+from api.brands_api import (
+    create_brand, lookup_brand_by_name, pre_approve_brand, assign_brand_to_rep,
+    update_customer_support_email, update_brand_profile, format_email, BRAND_EXISTS
+)
+from utils.gsheet_utils import get_sheet_records
+from utils import metrics, profiling
+from utils.local_db import STATE_DIR
+from utils.checkpoint import Checkpoint
+from utils.log_setup import configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ONBOARDING_CHECKPOINT_PATH = os.getenv(
+    'ONBOARDING_CHECKPOINT_PATH', os.path.join(STATE_DIR, 'onboarding_checkpoint.jsonl')
+)
+
+# step -> steps that must be done first
+STAGE_DEPENDENCIES = {
+    'create': [],
+    'lookup': ['create'],
+    'pre_approve': ['lookup'],
+    'assign_rep': ['pre_approve'],
+    'cs_email': ['lookup'],
+    'profile': ['lookup'],
+}
+STAGE_CONCURRENCY = {
+    'create': 4,
+    'lookup': 4,
+    'pre_approve': 4,
+    'assign_rep': 4,
+    'cs_email': 4,
+    'profile': 4,
+}
+
+# each step takes the brand row and its checkpoint entry and returns (ok, brand_id or None)
+def _create(row, progress):
+    result = create_brand(row['name'], brand_data=row)
+    if result is None:
+        return False, None
+    if result != BRAND_EXISTS:
+        return True, _created_brand_id(result)
+    # a rerun after a crash between create and checkpoint finds the brand already
+    # there. only the exact name counts, a lookalike may be someone else's brand
+    existing = lookup_brand_by_name(row['name'], exact=True)
+    return existing is not None, existing and existing['id']
+
+# the new brand's id when the create response carries one
+def _created_brand_id(result):
+    if not isinstance(result, dict):
+        return None
+    data = result.get('data')
+    return (data.get('id') if isinstance(data, dict) else None) or result.get('id')
+
+# a brand just created isn't indexed yet, so a normalized-name match could only find
+# an older lookalike. the exact name has to match or the step fails
+def _lookup(row, progress):
+    if progress.get('brand_id'):
+        return True, progress['brand_id']
+    brand = lookup_brand_by_name(row['name'], exact=True)
+    return brand is not None, brand and brand['id']
+
+def _pre_approve(row, progress):
+    return pre_approve_brand(progress['brand_id']), None
+
+def _assign_rep(row, progress):
+    return assign_brand_to_rep(progress['brand_id']), None
+
+def _cs_email(row, progress):
+    cs_email = row.get('csEmail') or format_email(row['name'])
+    return update_customer_support_email(progress['brand_id'], cs_email), None
+
+def _profile(row, progress):
+    return update_brand_profile(progress['brand_id'], row['name'], row, row), None
+
+STAGE_STEPS = {
+    'create': _create,
+    'lookup': _lookup,
+    'pre_approve': _pre_approve,
+    'assign_rep': _assign_rep,
+    'cs_email': _cs_email,
+    'profile': _profile,
+}
+
+# per-brand progress, one line appended per finished step so a rerun skips completed ones
+class OnboardingCheckpoint(Checkpoint):
+    def new_entry(self):
+        return {'brand_id': None, 'completed': [], 'failed': {}}
+
+    def apply(self, progress, event):
+        if event.get('brand_id'):
+            progress['brand_id'] = event['brand_id']
+        if event['ok']:
+            progress['completed'].append(event['stage'])
+            progress['failed'].pop(event['stage'], None)
+        else:
+            progress['failed'][event['stage']] = event.get('error') or 'failed'
+
+    def progress(self, brand_name):
+        return self.entry(brand_name)
+
+    def mark(self, brand_name, stage, ok, brand_id=None, error=None):
+        self.record(brand_name, stage=stage, ok=ok, brand_id=brand_id, error=error)
+
+def _ready_stages(progress, running):
+    completed = set(progress['completed'])
+    return [
+        stage for stage, dependencies in STAGE_DEPENDENCIES.items()
+        if stage not in completed
+        and stage not in running
+        and stage not in progress['failed']
+        and all(dependency in completed for dependency in dependencies)
+    ]
+
+def _run_step(stage, row, progress):
+    start = time.monotonic()
+    try:
+        ok, brand_id = STAGE_STEPS[stage](row, progress)
+        error = None
+    except Exception as e:
+        logger.exception(f"{stage} failed for brand {row['name']}")
+        ok, brand_id, error = False, None, str(e)
+    return ok, brand_id, error, time.monotonic() - start
+
+# run every brand through the step DAG. each stage has its own bounded pool, so
+# a brand moves on to its next steps as soon as the previous one finishes
+def run_pipeline(rows, checkpoint, stage_concurrency=None):
+    stage_concurrency = stage_concurrency or STAGE_CONCURRENCY
+    executors = {stage: ThreadPoolExecutor(max_workers=stage_concurrency[stage]) for stage in STAGE_STEPS}
+    stats = {stage: {'done': 0, 'failed': 0, 'busy': 0.0, 'first': None, 'last': None} for stage in STAGE_STEPS}
+    rows_by_name = {row['name']: row for row in rows}
+    in_flight = {}
+    running = {name: set() for name in rows_by_name}
+
+    def schedule(brand_name):
+        progress = checkpoint.progress(brand_name)
+        for stage in _ready_stages(progress, running[brand_name]):
+            running[brand_name].add(stage)
+            future = executors[stage].submit(_run_step, stage, rows_by_name[brand_name], dict(progress))
+            in_flight[future] = (brand_name, stage, time.monotonic())
+
+    try:
+        for brand_name in rows_by_name:
+            schedule(brand_name)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                brand_name, stage, submitted = in_flight.pop(future)
+                running[brand_name].discard(stage)
+                ok, brand_id, error, busy = future.result()
+                checkpoint.mark(brand_name, stage, ok, brand_id, error)
+
+                stage_stats = stats[stage]
+                stage_stats['done' if ok else 'failed'] += 1
+                stage_stats['busy'] += busy
+                stage_stats['first'] = min(stage_stats['first'] or submitted, submitted)
+                stage_stats['last'] = time.monotonic()
+                if ok:
+                    schedule(brand_name)
+                else:
+                    logger.error(f'brand {brand_name} stopped at {stage}: {error or "step returned failure"}')
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+    return stats
+
+def log_stage_throughput(stats):
+    for stage, stage_stats in stats.items():
+        total = stage_stats['done'] + stage_stats['failed']
+        if not total:
+            logger.info(f'stage {stage}: nothing to do')
+            continue
+        elapsed = max(stage_stats['last'] - stage_stats['first'], 1e-6)
+        logger.info(
+            f"stage {stage}: {stage_stats['done']} done, {stage_stats['failed']} failed, "
+            f"{total / elapsed:.2f} brands/s, avg {stage_stats['busy'] / total:.2f}s per brand"
+        )
+
+def load_brand_rows(csv_path=None, sheet=None, worksheet=None):
+    if csv_path:
+        with open(csv_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = get_sheet_records(sheet, worksheet)
+    rows = [{key: value for key, value in row.items() if value not in (None, '')} for row in rows]
+    return [row for row in rows if row.get('name')]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='onboard a batch of brands')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='csv with a "name" column plus optional brand fields')
+    source.add_argument('--sheet', help='google sheet with the same columns')
+    parser.add_argument('--worksheet', default='Sheet1')
+    parser.add_argument('--checkpoint', default=ONBOARDING_CHECKPOINT_PATH)
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    return parser.parse_args()
+
+def main(args):
+    token = get_flip_access_token()
+    if not token:
+        logger.error('could not obtain access token')
+        exit(1)
+
+    rows = load_brand_rows(args.csv, args.sheet, args.worksheet)
+    checkpoint = OnboardingCheckpoint(args.checkpoint)
+    # failed steps get another try on a rerun
+    for row in rows:
+        checkpoint.progress(row['name'])['failed'] = {}
+    logger.info(f'onboarding {len(rows)} brands')
+
+    start = time.monotonic()
+    stats = run_pipeline(rows, checkpoint)
+    log_stage_throughput(stats)
+    complete = sum(
+        1 for row in rows if set(checkpoint.progress(row['name'])['completed']) == set(STAGE_STEPS)
+    )
+    logger.info(f'{complete}/{len(rows)} brands fully onboarded in {time.monotonic() - start:.1f}s')
+
+if __name__ == '__main__':
+    configure_logging()
+    args = parse_args()
+    with metrics.job('onboard_brands'), profiling.profiled('onboard_brands', args.profile):
+        main(args)
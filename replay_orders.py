@@ -0,0 +1,192 @@
+import os
+import json
+import pickle
+import time
+import logging
+import argparse
+from datetime import datetime
+from api.auth_api import get_flip_access_token
+from api.orders_api import iter_orders, get_order_details_many
+from api.order_views import project_order, OrderView, ItemView
+from main import build_policies, judge_order, load_banned_device_ids_safe, ACTION_VERDICTS
+from utils import order_archive, metrics, profiling
+from utils.state_files import atomic_write
+from utils.policy_engine import log_report
+from utils.log_setup import configure_logging, log_job_summary
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COMPARE_LOG_LIMIT = 20 # changed actions listed individually when comparing replays
+
+def default_archive_path():
+    return os.path.join(order_archive.ARCHIVE_DIR, f"orders-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+
+# read-only pass over the live API: every order in any policy's states, its details
+# and the current block list go into the archive. nothing is approved or cancelled
+def record_orders(path, max_orders=None):
+    started = time.monotonic()
+    token = get_flip_access_token()
+    if not token:
+        logger.error('could not obtain access token')
+        exit(1)
+
+    banned_device_ids = load_banned_device_ids_safe()
+    states = sorted(set().union(*(policy['states'] for policy in build_policies(banned_device_ids))))
+    with order_archive.recording(path) as writer:
+        if banned_device_ids:
+            writer.write('banned_device_ids', ids=sorted(banned_device_ids))
+        orders = list(iter_orders(token, states=states, max_orders=max_orders))
+        details = get_order_details_many(token, orders)
+    logger.info(f'recorded {writer.counts} to {path}')
+    log_job_summary(
+        'record_orders', started, listed=len(orders), fetched=sum(detail is not None for detail in details),
+        failed=details.count(None), archive=path
+    )
+
+# list rows by order id (the latest page wins), projected details by order id and
+# the recorded block list
+def _parse_archive(path):
+    rows, views, banned_device_ids = {}, {}, None
+    for record in order_archive.iter_records(path):
+        kind = record['kind']
+        if kind == 'list':
+            for row in record['rows']:
+                rows[row['id']] = row
+        elif kind == 'detail':
+            views[record['id']] = project_order(record['detail'], record['id'])
+        elif kind == 'banned_device_ids':
+            banned_device_ids = set(record['ids'])
+    return rows, views, banned_device_ids
+
+# parsing the raw json is most of a replay, so the projected archive is pickled next
+# to it and reused until the archive or the view fields change
+def load_archive(path):
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns, OrderView.__slots__, ItemView.__slots__)
+    cache_path = f'{path}.views.pickle'
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, loaded = pickle.load(f)
+        if cached_key == key:
+            return loaded
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+
+    loaded = _parse_archive(path)
+    try:
+        atomic_write(cache_path, pickle.dumps((key, loaded), protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        logger.warning(f'could not write projected archive cache {cache_path}')
+    return loaded
+
+# the sweep's prefilter and ownership rules over recorded orders, without the ledger.
+# actions are collected instead of sent. returns (verdicts, [(action, order_id, policy name)], missing)
+def replay(rows, views, policies):
+    verdicts = {policy['name']: {} for policy in policies}
+    actions = []
+    missing = 0
+
+    def tally(policy, verdict):
+        counts = verdicts[policy['name']]
+        counts[verdict] = counts.get(verdict, 0) + 1
+
+    for order_id, row in rows.items():
+        survivors = []
+        for policy in policies:
+            if row.get('state') not in policy['states']:
+                continue
+            if policy['rules'].prefilter(row):
+                survivors.append(policy)
+            else:
+                tally(policy, 'prefiltered')
+        if not survivors:
+            continue
+        order_view = views.get(order_id)
+        if order_view is None:
+            missing += 1
+            continue
+        owner, passed = judge_order(survivors, order_id, order_view)
+        for policy, verdict in passed:
+            tally(policy, verdict)
+        if owner:
+            policy, action = owner
+            tally(policy, ACTION_VERDICTS[action])
+            actions.append((action, order_id, policy['name']))
+    return verdicts, actions, missing
+
+# actions that appear in only one of two replays, e.g. before and after a rule change
+def compare_actions(previous, current):
+    previous, current = set(map(tuple, previous)), set(map(tuple, current))
+    added, removed = sorted(current - previous), sorted(previous - current)
+    logger.info(f'compared with previous replay: {len(added)} new actions, {len(removed)} dropped')
+    for label, changed in (('new', added), ('dropped', removed)):
+        for action, order_id, policy in changed[:COMPARE_LOG_LIMIT]:
+            logger.info(f'{label}: {policy} would {action} {order_id}')
+        if len(changed) > COMPARE_LOG_LIMIT:
+            logger.info(f'... and {len(changed) - COMPARE_LOG_LIMIT} more {label}')
+    return added, removed
+
+def replay_archive(path, policy_names=None, output=None, compare=None):
+    started = time.monotonic()
+    rows, views, banned_device_ids = load_archive(path)
+    loaded = time.monotonic()
+
+    policies = build_policies(banned_device_ids)
+    if policy_names:
+        policies = [policy for policy in policies if policy['name'] in policy_names]
+    verdicts, actions, missing = replay(rows, views, policies)
+    evaluated = time.monotonic()
+
+    for name, counts in verdicts.items():
+        logger.info(f'replay policy {name}: {counts}')
+    for policy in policies:
+        log_report(policy['rules'])
+    if compare:
+        with open(compare) as f:
+            compare_actions(json.load(f)['actions'], actions)
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'archive': path, 'verdicts': verdicts, 'actions': actions}, f, indent=2)
+
+    load_seconds, evaluate_seconds = loaded - started, evaluated - loaded
+    log_job_summary(
+        'replay_orders', started, orders=len(rows), details=len(views), missing_details=missing,
+        matched=len(actions), verdicts=verdicts, load_seconds=round(load_seconds, 3),
+        evaluate_seconds=round(evaluate_seconds, 3),
+        orders_per_second=round(len(rows) / (evaluated - started)) if evaluated > started else None,
+        evaluated_per_second=round(len(rows) / evaluate_seconds) if evaluate_seconds else None
+    )
+    return verdicts, actions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='record order API responses, or replay the order policies over a recording')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help='capture every order the policies cover (read-only)')
+    record.add_argument('--archive', help='archive to write (default: state/archives/orders-<timestamp>.jsonl.gz)')
+    record.add_argument('--max-orders', type=int, help='stop listing after this many orders')
+
+    replay = commands.add_parser('replay', help='run the policies over an archive, nothing is sent')
+    replay.add_argument('archive')
+    replay.add_argument('--policies', help='comma separated subset of policy names')
+    replay.add_argument('--output', help='write verdicts and would-be actions to this json file')
+    replay.add_argument('--compare', help='an earlier --output to diff the would-be actions against')
+    return parser.parse_args()
+
+def main(args):
+    if args.command == 'record':
+        with metrics.job('record_orders'):
+            record_orders(args.archive or default_archive_path(), args.max_orders)
+    else:
+        policy_names = set(args.policies.split(',')) if args.policies else None
+        replay_archive(args.archive, policy_names, args.output, args.compare)
+
+if __name__ == '__main__':
+    configure_logging()
+    args = parse_args()
+    with profiling.profiled(f'{args.command}_orders', args.profile):
+        main(args)
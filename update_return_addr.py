@@ -1,34 +1,116 @@
 import os
+import csv
 import logging
-import time
-from api.brands_api import update_return_addr
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from api.brands_api import update_return_addr, refresh_brand_index, RETURN_ADDRESS
 from api.auth_api import get_flip_access_token
+from utils import brand_index, metrics, profiling
+from utils.local_db import STATE_DIR
+from utils.checkpoint import Checkpoint
+from utils.log_setup import configure_logging
+from utils.gsheet_utils import get_sheet_column
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
+RETURN_ADDR_WORKERS = int(os.getenv('RETURN_ADDR_WORKERS', '8'))
+RETURN_ADDR_CHECKPOINT_PATH = os.getenv(
+    'RETURN_ADDR_CHECKPOINT_PATH', os.path.join(STATE_DIR, 'return_addr_checkpoint.jsonl')
+)
+
+# one brand id per line, or the first column of a csv
+def load_brand_ids(path=None, sheet=None, worksheet=None, column=1):
+    if sheet:
+        brand_ids = get_sheet_column(sheet, worksheet, column)
+    else:
+        with open(path, newline='') as f:
+            brand_ids = [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+        if brand_ids and brand_ids[0].lower() in ('id', 'brand_id', 'brandid'):
+            brand_ids = brand_ids[1:]
+    return list(dict.fromkeys(brand_ids))
+
+def current_return_address(brand):
+    return (brand.get('operationData') or {}).get('orderReturnDCAddress') or brand.get('orderReturnDCAddress')
+
+def address_matches(current, target):
+    if not current:
+        return False
+    return all(str(current.get(key) or '').strip().lower() == str(value).strip().lower() for key, value in target.items())
+
+# brands already at the target are dropped; brands the index does not know are kept
+def brands_needing_update(brand_ids, target):
+    known = brand_index.find_by_ids(brand_ids)
+    return [
+        brand_id for brand_id in brand_ids
+        if brand_id not in known or not address_matches(current_return_address(known[brand_id]), target)
+    ]
+
+def update_brands(token, brand_ids, checkpoint, max_workers=None):
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or RETURN_ADDR_WORKERS) as executor:
+        futures = {
+            executor.submit(update_return_addr, brand_id, token, address=checkpoint.scope): brand_id
+            for brand_id in brand_ids
+        }
+        for future in as_completed(futures):
+            brand_id = futures[future]
+            try:
+                results[brand_id] = future.result()
+            except Exception:
+                logger.exception(f'failed to update return address for brand {brand_id}')
+                results[brand_id] = None
+            if results[brand_id] is not None:
+                checkpoint.record(brand_id, done=True)
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='point brands at the RETURN_ADDRESS return address')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help='brand ids, one per line or first csv column')
+    source.add_argument('--sheet', help='google sheet holding the brand ids')
+    parser.add_argument('--worksheet', default='Sheet1')
+    parser.add_argument('--column', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=RETURN_ADDR_WORKERS)
+    parser.add_argument('--checkpoint', default=RETURN_ADDR_CHECKPOINT_PATH)
+    parser.add_argument('--dry-run', action='store_true', help='only report which brands differ')
+    parser.add_argument('--profile', action='store_true', help='write a cpu, allocation and wall-clock profile of the run')
+    return parser.parse_args()
+
+def main(args):
     token = get_flip_access_token()
     if not token:
-        print('failed to retrieve access token')
+        logger.error('failed to retrieve access token')
         return
 
-    brand_ids = [
-        "68017c906433cdb7fb57e471",
-        "68013af046ae3dcf22c6ba81"
-    ]
+    brand_ids = load_brand_ids(args.file, args.sheet, args.worksheet, args.column)
+    # brands already updated to RETURN_ADDRESS; a different address starts over
+    checkpoint = Checkpoint(args.checkpoint, scope=RETURN_ADDRESS)
+    pending = [brand_id for brand_id in brand_ids if brand_id not in checkpoint.entries]
 
-    results = {}
-    for brand_id in brand_ids:
-        print(f'\nprocessing brand: {brand_id}')
-        result = update_return_addr(brand_id, token)
-        results[brand_id] = result
-        time.sleep(1)
+    # one full pass over the brand list reads every current address; an incremental
+    # refresh would miss address changes on brands that already exist
+    refresh_brand_index(full=True)
+    to_update = brands_needing_update(pending, RETURN_ADDRESS)
+    logger.info(
+        f'{len(brand_ids)} brands: {len(brand_ids) - len(pending)} done in an earlier run, '
+        f'{len(pending) - len(to_update)} already at the target address, {len(to_update)} to update'
+    )
+    if args.dry_run:
+        return {brand_id: None for brand_id in to_update}
+
+    results = update_brands(token, to_update, checkpoint, args.workers)
+    failed = [brand_id for brand_id, result in results.items() if result is None]
+    logger.info(f'updated {len(results) - len(failed)} brands, {len(failed)} failed')
+    for brand_id in failed:
+        logger.error(f'return address not updated for brand {brand_id}')
     return results
 
 if __name__ == '__main__':
-    print('Starting address updates...')
-    main()
\ No newline at end of file
+    configure_logging()
+    logger.info('Starting address updates...')
+    args = parse_args()
+    with metrics.job('update_return_addr'), profiling.profiled('update_return_addr', args.profile):
+        main(args)
@@ -0,0 +1,129 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from utils.local_db import get_connection
+
+logger = logging.getLogger(__name__)
+
+BRAND_INDEX_TTL = int(os.getenv('BRAND_INDEX_TTL', '300')) # seconds before new brands are pulled again
+
+_schema_ready = False
+_memory = None # {'by_id': {}, 'by_name': {}, 'by_normalized': {}} mirror of the table
+_memory_lock = threading.Lock()
+
+def _ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS brand_index (
+                brand_id TEXT PRIMARY KEY,
+                name TEXT,
+                normalized_name TEXT,
+                created_at TEXT,
+                data TEXT,
+                indexed_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_brand_index_normalized ON brand_index (normalized_name)")
+        conn.execute("CREATE TABLE IF NOT EXISTS brand_index_meta (key TEXT PRIMARY KEY, value TEXT)")
+    _schema_ready = True
+
+# "The Ordinary, Inc." and "the ordinary inc" land on the same key
+def normalize_brand_name(name):
+    return re.sub(r'[^a-z0-9]+', '', (name or '').lower())
+
+def _load_memory():
+    global _memory
+    with _memory_lock:
+        if _memory is not None:
+            return _memory
+        _ensure_schema()
+        memory = {'by_id': {}, 'by_name': {}, 'by_normalized': {}}
+        for (data,) in get_connection().execute("SELECT data FROM brand_index ORDER BY created_at"):
+            _remember(memory, json.loads(data))
+        _memory = memory
+        return _memory
+
+# newer brands win a name clash because rows are remembered oldest first
+def _remember(memory, brand):
+    memory['by_id'][brand['id']] = brand
+    if brand.get('name'):
+        memory['by_name'][brand['name']] = brand
+        memory['by_normalized'][normalize_brand_name(brand['name'])] = brand
+
+def index_brands(brands):
+    brands = [brand for brand in brands if brand.get('id')]
+    if not brands:
+        return
+    _ensure_schema()
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO brand_index VALUES (?, ?, ?, ?, ?, ?)",
+            [(brand['id'], brand.get('name'), normalize_brand_name(brand.get('name')),
+              None if brand.get('createdAt') is None else str(brand['createdAt']), json.dumps(brand), now)
+             for brand in brands]
+        )
+    memory = _load_memory()
+    with _memory_lock:
+        for brand in sorted(brands, key=lambda brand: str(brand.get('createdAt') or '')):
+            _remember(memory, brand)
+
+# exact name first, then the normalized name unless exact is set
+def find_by_name(brand_name, exact=False):
+    memory = _load_memory()
+    if exact:
+        return memory['by_name'].get(brand_name)
+    return memory['by_name'].get(brand_name) or memory['by_normalized'].get(normalize_brand_name(brand_name))
+
+def find_by_id(brand_id):
+    return _load_memory()['by_id'].get(brand_id)
+
+# {brand_id: brand} for the ids that are indexed
+def find_by_ids(brand_ids):
+    by_id = _load_memory()['by_id']
+    return {brand_id: by_id[brand_id] for brand_id in brand_ids if brand_id in by_id}
+
+# keep the indexed copy in line after a successful address PATCH
+def set_return_address(brand_id, address):
+    brand = find_by_id(brand_id)
+    if brand is None:
+        return
+    operation_data = dict(brand.get('operationData') or {})
+    operation_data['orderReturnDCAddress'] = dict(address)
+    index_brands([dict(brand, operationData=operation_data)])
+
+def count():
+    return len(_load_memory()['by_id'])
+
+def _get_meta(key):
+    _ensure_schema()
+    row = get_connection().execute("SELECT value FROM brand_index_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(key, value):
+    _ensure_schema()
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO brand_index_meta VALUES (?, ?)", (key, str(value)))
+
+# newest createdAt seen so far; refreshes page newest-first and stop once they reach it
+def get_watermark():
+    return _get_meta('created_at_watermark')
+
+def set_watermark(value):
+    _set_meta('created_at_watermark', value)
+
+def is_stale():
+    refreshed_at = _get_meta('refreshed_at')
+    return refreshed_at is None or time.time() - float(refreshed_at) >= BRAND_INDEX_TTL
+
+def mark_refreshed():
+    _set_meta('refreshed_at', time.time())
@@ -0,0 +1,70 @@
+import json
+import logging
+import threading
+from utils.state_files import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# per-key progress for a resumable batch job, kept as an append-only jsonl file:
+# a {"scope": ...} header, then one {"key": ..., "event": {...}} line per update.
+# an update costs one appended line however many keys there are. loading replays
+# the events and rewrites the file as one {"key": ..., "entry": {...}} line per key.
+# a different scope (e.g. a new target address) starts over
+class Checkpoint:
+    def __init__(self, path, scope=None):
+        self.path = path
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.entries = {}
+        self._load()
+
+    # a key's state before any event; subclasses shape it
+    def new_entry(self):
+        return {}
+
+    # fold one event into a key's state; subclasses decide what an event means
+    def apply(self, entry, event):
+        entry.update(event)
+
+    def entry(self, key):
+        return self.entries.setdefault(key, self.new_entry())
+
+    def record(self, key, **event):
+        line = json.dumps({'key': key, 'event': event}) + '\n'
+        with self.lock:
+            self.apply(self.entry(key), event)
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        header = _parse_line(lines[0]) if lines else None
+        if header is not None and header.get('scope') == self.scope:
+            for line in lines[1:]:
+                record = _parse_line(line)
+                if record is None:
+                    continue
+                if 'entry' in record:
+                    self.entries[record['key']] = record['entry']
+                else:
+                    self.apply(self.entry(record['key']), record['event'])
+        elif lines:
+            logger.info(f'checkpoint {self.path} is for a different run, starting over')
+        self._compact()
+
+    def _compact(self):
+        lines = [json.dumps({'scope': self.scope})]
+        lines.extend(json.dumps({'key': key, 'entry': entry}) for key, entry in self.entries.items())
+        atomic_write(self.path, '\n'.join(lines) + '\n')
+
+# a crash can leave the last line half written
+def _parse_line(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
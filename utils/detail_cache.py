@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+from utils.local_db import get_connection
+
+logger = logging.getLogger(__name__)
+
+DETAIL_CACHE_ENABLED = os.getenv('DETAIL_CACHE_ENABLED', '1') == '1'
+DETAIL_CACHE_TTL = int(os.getenv('DETAIL_CACHE_TTL', '300')) # seconds
+DETAIL_CACHE_MAX_BYTES = int(os.getenv('DETAIL_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+EVICT_EVERY = 50 # puts between byte budget checks
+
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+_puts = 0
+_schema_ready = False
+
+def _ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_detail_cache (
+                order_id TEXT PRIMARY KEY,
+                state TEXT,
+                updated_at TEXT,
+                body BLOB,
+                size INTEGER,
+                fetched_at REAL,
+                accessed_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_detail_cache_accessed ON order_detail_cache (accessed_at)")
+    _schema_ready = True
+
+def _count(key, n=1):
+    with _stats_lock:
+        stats[key] += n
+
+# cached detail for the order, or None. state/updated_at come from the list row
+# and must match what was cached; without them only the TTL applies
+def get(order_id, state=None, updated_at=None):
+    if not DETAIL_CACHE_ENABLED:
+        return None
+    _ensure_schema()
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT state, updated_at, body, fetched_at FROM order_detail_cache WHERE order_id = ?", (order_id,)
+    ).fetchone()
+    now = time.time()
+    if (
+        row is None
+        or now - row[3] > DETAIL_CACHE_TTL
+        or (state is not None and row[0] != state)
+        or (updated_at is not None and row[1] != str(updated_at))
+    ):
+        _count('misses')
+        return None
+
+    with conn:
+        conn.execute("UPDATE order_detail_cache SET accessed_at = ? WHERE order_id = ?", (now, order_id))
+    _count('hits')
+    return json.loads(zlib.decompress(row[2]))
+
+# state/updated_at fall back to the list row's values when the detail lacks them
+def put(order_id, detail, state=None, updated_at=None):
+    global _puts
+    if not DETAIL_CACHE_ENABLED:
+        return
+    _ensure_schema()
+    order_obj = detail.get('order', {})
+    state = order_obj.get('state', state)
+    updated_at = order_obj.get('updatedAt', updated_at)
+    body = zlib.compress(json.dumps(detail).encode())
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO order_detail_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (order_id, state, None if updated_at is None else str(updated_at), body, len(body), now, now)
+        )
+    with _stats_lock:
+        _puts += 1
+        check_budget = _puts % EVICT_EVERY == 0
+    if check_budget:
+        evict()
+
+def invalidate(order_id):
+    if not DETAIL_CACHE_ENABLED:
+        return
+    _ensure_schema()
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM order_detail_cache WHERE order_id = ?", (order_id,))
+
+# drop least recently used entries until the cache fits its byte budget
+def evict():
+    _ensure_schema()
+    conn = get_connection()
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM order_detail_cache").fetchone()[0]
+    if total <= DETAIL_CACHE_MAX_BYTES:
+        return 0
+
+    evicted = 0
+    rows = conn.execute("SELECT order_id, size FROM order_detail_cache ORDER BY accessed_at").fetchall()
+    doomed = []
+    for order_id, size in rows:
+        if total <= DETAIL_CACHE_MAX_BYTES:
+            break
+        doomed.append((order_id,))
+        total -= size
+        evicted += 1
+    with conn:
+        conn.executemany("DELETE FROM order_detail_cache WHERE order_id = ?", doomed)
+    _count('evictions', evicted)
+    logger.info(f'evicted {evicted} cached order details to stay under {DETAIL_CACHE_MAX_BYTES} bytes')
+    return evicted
+
+def hit_rate():
+    lookups = stats['hits'] + stats['misses']
+    return stats['hits'] / lookups if lookups else 0.0
@@ -1,18 +1,106 @@
-import gspread
-from google.oauth2.service_account import Credentials
+import os
+import json
+import time
+import logging
+from dotenv import load_dotenv
+from utils import metrics, profiling
+from utils.local_db import STATE_DIR
+from utils.state_files import atomic_write_json
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BANNED_DEVICE_SPREADSHEET = "Disputed fraud orders"
+BANNED_DEVICE_WORKSHEET = 'Block list phase 1'
+BANNED_DEVICE_SNAPSHOT_PATH = os.getenv(
+    'BANNED_DEVICE_SNAPSHOT_PATH', os.path.join(STATE_DIR, 'banned_device_ids.json')
+)
+BANNED_DEVICE_TTL = int(os.getenv('BANNED_DEVICE_TTL', '600')) # seconds before the sheet is checked again
+GSHEET_TIMEOUT = float(os.getenv('GSHEET_TIMEOUT', '20'))
+
+# google sheets API setup. gspread/google-auth are only imported when a sheet is actually read
+def get_gspread_client():
+    import gspread
+    from google.oauth2.service_account import Credentials
 
-# google sheets API setup
-def setup_google_sheets():
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/spreadsheets",
              "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
     creds = Credentials.from_service_account_file('utils/gsheet_creds.json', scopes=scope)
-    client = gspread.authorize(creds)
-    sheet = client.open("Disputed fraud orders").worksheet('Block list phase 1')
-    # banned_device_id_list = sheet.col_values(3)
-    return sheet
+    with metrics.timed('gsheet', 'authorize'), profiling.activity('network'):
+        client = gspread.authorize(creds)
+    if hasattr(client, 'set_timeout'):
+        client.set_timeout(GSHEET_TIMEOUT)
+    return client
+
+# opening by key skips the drive search that opening by name costs
+def open_spreadsheet(name, spreadsheet_id=None):
+    client = get_gspread_client()
+    with metrics.timed('gsheet', 'open_by_key' if spreadsheet_id else 'open'), profiling.activity('network'):
+        if spreadsheet_id:
+            return client.open_by_key(spreadsheet_id)
+        return client.open(name)
+
+def setup_google_sheets():
+    return open_spreadsheet(BANNED_DEVICE_SPREADSHEET).worksheet(BANNED_DEVICE_WORKSHEET)
 
-#get list of banned device ids from column C 
+def normalize_device_id(device_id):
+    return device_id.strip().lower()
+
+def _load_snapshot():
+    try:
+        with open(BANNED_DEVICE_SNAPSHOT_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_snapshot(snapshot):
+    atomic_write_json(BANNED_DEVICE_SNAPSHOT_PATH, snapshot)
+
+#get the set of normalized banned device ids from column C.
+# served from a local snapshot that is only re-downloaded when the sheet's
+# modified time changes; if sheets is unreachable the last good snapshot is used
 def get_banned_device_ids():
-    sheet = setup_google_sheets()
-    banned_device_id_list = sheet.col_values(3)
-    return banned_device_id_list
+    snapshot = _load_snapshot()
+    now = time.time()
+    if snapshot and now - snapshot['checked_at'] < BANNED_DEVICE_TTL:
+        return set(snapshot['device_ids'])
+
+    try:
+        spreadsheet = open_spreadsheet(BANNED_DEVICE_SPREADSHEET, snapshot and snapshot.get('spreadsheet_id'))
+        modified_time = getattr(spreadsheet, 'lastUpdateTime', None)
+        if snapshot and modified_time and modified_time == snapshot.get('modified_time'):
+            snapshot['checked_at'] = now
+            _save_snapshot(snapshot)
+            logger.info('banned device sheet unchanged, reusing snapshot')
+            return set(snapshot['device_ids'])
+
+        with metrics.timed('gsheet', 'col_values'), profiling.activity('network'):
+            banned_device_id_list = spreadsheet.worksheet(BANNED_DEVICE_WORKSHEET).col_values(3)
+        device_ids = {normalize_device_id(device) for device in banned_device_id_list if device.strip()}
+        _save_snapshot({
+            'spreadsheet_id': spreadsheet.id,
+            'modified_time': modified_time,
+            'checked_at': now,
+            'device_ids': sorted(device_ids)
+        })
+        logger.info(f'downloaded {len(device_ids)} banned device ids')
+        return device_ids
+    except Exception:
+        if snapshot:
+            logger.exception('failed to refresh banned device sheet, using last snapshot')
+            return set(snapshot['device_ids'])
+        raise
+
+# every row of a worksheet as a dict keyed by the header row
+def get_sheet_records(spreadsheet_name, worksheet_name):
+    worksheet = open_spreadsheet(spreadsheet_name).worksheet(worksheet_name)
+    with metrics.timed('gsheet', 'get_all_records'), profiling.activity('network'):
+        return worksheet.get_all_records()
+
+# non-empty cells of one column, header row excluded
+def get_sheet_column(spreadsheet_name, worksheet_name, column):
+    worksheet = open_spreadsheet(spreadsheet_name).worksheet(worksheet_name)
+    with metrics.timed('gsheet', 'col_values'), profiling.activity('network'):
+        values = worksheet.col_values(column)
+    return [value.strip() for value in values[1:] if value.strip()]
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', os.path.join(STATE_DIR, 'ops_state.db'))
+
+_local = threading.local()
+
+# one sqlite connection per thread, all pointing at the same local state db
+def get_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(STATE_DB_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(STATE_DB_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    return conn
+
+# split a list into sqlite-sized chunks for "IN (?, ?, ...)" queries
+def chunked(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', os.path.join('logs', 'ops_automations.log'))
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '50')) # keep 1 in N per-order DEBUG lines per call site
+# console output defaults to interactive runs only; under launchd stderr is a file that never rotates
+LOG_TO_CONSOLE = os.getenv('LOG_TO_CONSOLE', '1' if sys.stderr.isatty() else '0') == '1'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s'
+
+logger = logging.getLogger(__name__)
+
+_listener = None
+_configure_lock = threading.Lock()
+
+# per-order DEBUG lines come from a handful of call sites that fire thousands of
+# times a cycle; keep every Nth line from each site and drop the rest
+class SamplingFilter(logging.Filter):
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(every, 1)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        with self.lock:
+            count = self.counts.get(site, 0)
+            self.counts[site] = count + 1
+        if count % self.every:
+            return False
+        if count:
+            record.msg = f'{record.msg} [sampled 1/{self.every}, {count + 1} so far]'
+        return True
+
+# one queue-backed root handler; formatting and file writes happen on the
+# listener's thread, never on the worker threads fetching orders. safe to call
+# from every entry point, only the first call configures anything
+def configure_logging(level=None, log_file=LOG_FILE, console=None):
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        if console if console is not None else (LOG_TO_CONSOLE or not log_file):
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level or LOG_LEVEL)
+        # urllib3 logs every retry and new connection at DEBUG
+        logging.getLogger('urllib3').setLevel(logging.INFO)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# one structured line per job run: counts plus duration, as a json object
+def log_job_summary(job, started, **counts):
+    summary = {'job': job, 'duration_seconds': round(time.monotonic() - started, 3)}
+    summary.update(counts)
+    logger.info(f'job summary {json.dumps(summary, default=str)}')
+    return summary
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+from utils.local_db import STATE_DIR
+from utils.state_files import atomic_write, atomic_write_json
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+METRICS_TEXTFILE_PATH = os.getenv('METRICS_TEXTFILE_PATH', os.path.join(STATE_DIR, 'metrics.prom'))
+METRICS_JSON_PATH = os.getenv('METRICS_JSON_PATH', os.path.join(STATE_DIR, 'metrics.json'))
+METRICS_SAMPLE_SIZE = int(os.getenv('METRICS_SAMPLE_SIZE', '10000')) # latencies kept per endpoint for percentiles
+# histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# path segments holding a digit are ids (a version segment like v2 aside), collapsed
+# so every order shares one endpoint label
+_ID_SEGMENT = re.compile(r'^(?!v\d+$).*\d')
+
+def endpoint_label(method, url):
+    path = re.sub(r'^[a-z]+://[^/]+', '', url).split('?', 1)[0]
+    segments = ['{id}' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = []
+
+    def observe(self, seconds, error, received):
+        self.count += 1
+        self.errors += bool(error)
+        self.bytes += received or 0
+        self.seconds += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        # reservoir sample, so long-running processes keep a fair picture of every cycle
+        if len(self.samples) < METRICS_SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < METRICS_SAMPLE_SIZE:
+                self.samples[slot] = seconds
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 6),
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+_lock = threading.Lock()
+_endpoints = {}  # (source, endpoint) -> EndpointStats
+_jobs = {}  # job -> {'runs', 'failures', 'last_seconds', 'total_seconds', 'last_status', 'last_finished'}
+_started = time.time()
+
+def observe(source, endpoint, seconds, error=False, received=0):
+    with _lock:
+        stats = _endpoints.get((source, endpoint))
+        if stats is None:
+            stats = _endpoints[(source, endpoint)] = EndpointStats()
+        stats.observe(seconds, error, received)
+
+# times a block as one call; an exception counts as an error and is re-raised
+@contextmanager
+def timed(source, endpoint):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe(source, endpoint, time.perf_counter() - start, error=True)
+        raise
+    observe(source, endpoint, time.perf_counter() - start)
+
+# times a whole job run and writes the snapshot files when it ends
+@contextmanager
+def job(name, export_on_exit=True):
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except SystemExit as e:
+        status = 'ok' if not e.code else 'failed'
+        raise
+    except BaseException:
+        status = 'failed'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            stats = _jobs.setdefault(name, {'runs': 0, 'failures': 0, 'total_seconds': 0.0})
+            stats['runs'] += 1
+            stats['failures'] += status != 'ok'
+            stats['total_seconds'] += elapsed
+            stats['last_seconds'] = elapsed
+            stats['last_status'] = status
+            stats['last_finished'] = time.time()
+        logger.info(f'job {name} finished in {elapsed:.2f}s ({status})')
+        if export_on_exit:
+            export()
+
+def snapshot():
+    with _lock:
+        return {
+            'generated_at': time.time(),
+            'process_started_at': _started,
+            'endpoints': [
+                dict(source=source, endpoint=endpoint, **stats.summary())
+                for (source, endpoint), stats in sorted(_endpoints.items())
+            ],
+            'jobs': {name: dict(stats) for name, stats in _jobs.items()},
+        }
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# prometheus text exposition format, for the node_exporter textfile collector or /metrics
+def render_prometheus():
+    lines = [
+        '# HELP flip_request_duration_seconds Latency of outbound calls per endpoint.',
+        '# TYPE flip_request_duration_seconds histogram',
+    ]
+    with _lock:
+        endpoints = sorted(_endpoints.items())
+        jobs = {name: dict(stats) for name, stats in _jobs.items()}
+        for (source, endpoint), stats in endpoints:
+            labels = f'source="{_escape(source)}",endpoint="{_escape(endpoint)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'flip_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'flip_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f'flip_request_duration_seconds_sum{{{labels}}} {stats.seconds:.6f}')
+            lines.append(f'flip_request_duration_seconds_count{{{labels}}} {stats.count}')
+        lines += ['# HELP flip_request_errors_total Failed outbound calls per endpoint.', '# TYPE flip_request_errors_total counter']
+        lines += [
+            f'flip_request_errors_total{{source="{_escape(source)}",endpoint="{_escape(endpoint)}"}} {stats.errors}'
+            for (source, endpoint), stats in endpoints
+        ]
+        lines += ['# HELP flip_response_bytes_total Bytes received per endpoint.', '# TYPE flip_response_bytes_total counter']
+        lines += [
+            f'flip_response_bytes_total{{source="{_escape(source)}",endpoint="{_escape(endpoint)}"}} {stats.bytes}'
+            for (source, endpoint), stats in endpoints
+        ]
+    lines += [
+        '# HELP flip_job_runs_total Job runs.', '# TYPE flip_job_runs_total counter',
+        *(f'flip_job_runs_total{{job="{_escape(name)}"}} {stats["runs"]}' for name, stats in jobs.items()),
+        '# HELP flip_job_failures_total Job runs that failed.', '# TYPE flip_job_failures_total counter',
+        *(f'flip_job_failures_total{{job="{_escape(name)}"}} {stats["failures"]}' for name, stats in jobs.items()),
+        '# HELP flip_job_last_duration_seconds Duration of the latest run.', '# TYPE flip_job_last_duration_seconds gauge',
+        *(f'flip_job_last_duration_seconds{{job="{_escape(name)}"}} {stats["last_seconds"]:.6f}' for name, stats in jobs.items()),
+        '# HELP flip_job_last_finished_timestamp_seconds When the latest run ended.',
+        '# TYPE flip_job_last_finished_timestamp_seconds gauge',
+        *(f'flip_job_last_finished_timestamp_seconds{{job="{_escape(name)}"}} {stats["last_finished"]:.3f}' for name, stats in jobs.items()),
+    ]
+    return '\n'.join(lines) + '\n'
+
+# metrics must never take a job down, so write failures are only logged
+def export():
+    try:
+        atomic_write(METRICS_TEXTFILE_PATH, render_prometheus())
+        atomic_write_json(METRICS_JSON_PATH, snapshot(), indent=2)
+    except OSError as e:
+        logger.warning(f'failed to write metrics snapshot: {e}')
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body, content_type = json.dumps(snapshot()).encode(), 'application/json'
+        elif self.path.startswith('/metrics'):
+            body, content_type = render_prometheus().encode(), 'text/plain; version=0.0.4'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# /metrics (prometheus) and /metrics.json for long-running processes
+def start_http_exporter(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f'serving metrics on http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from utils.local_db import STATE_DIR
+from utils.state_files import atomic_write
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MUTATION_JOURNAL_PATH = os.getenv(
+    'MUTATION_JOURNAL_PATH', os.path.join(STATE_DIR, 'mutation_journal.jsonl')
+)
+JOURNAL_RETENTION_DAYS = int(os.getenv('JOURNAL_RETENTION_DAYS', '30'))
+JOURNAL_COMPACT_BYTES = 5 * 1024 * 1024
+
+_lock = threading.Lock()
+
+# intents are fsynced before the request goes out, so a crash can never lose one
+def _append(entry, sync=False):
+    line = json.dumps(entry) + '\n'
+    with _lock:
+        os.makedirs(os.path.dirname(MUTATION_JOURNAL_PATH) or '.', exist_ok=True)
+        with open(MUTATION_JOURNAL_PATH, 'a') as f:
+            f.write(line)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+def record_intent(run_id, action, order_id):
+    _append({'ts': time.time(), 'run': run_id, 'phase': 'intent', 'action': action, 'order_id': order_id}, sync=True)
+
+def record_outcome(run_id, action, order_id, success, detail=None):
+    _append({
+        'ts': time.time(), 'run': run_id, 'phase': 'outcome', 'action': action, 'order_id': order_id,
+        'success': bool(success), 'detail': detail
+    })
+
+def _read_entries():
+    entries = []
+    try:
+        with open(MUTATION_JOURNAL_PATH) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # a torn last line from a crash mid-write
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+# latest (state, ts) per (action, order_id) within the retention window. state is
+# 'pending' (sent, outcome unknown), 'succeeded' or 'failed'
+def load_status():
+    cutoff = time.time() - JOURNAL_RETENTION_DAYS * 86400
+    with _lock:
+        latest = {}
+        for entry in _read_entries():
+            latest[(entry['action'], entry['order_id'])] = entry
+        if os.path.exists(MUTATION_JOURNAL_PATH) and os.path.getsize(MUTATION_JOURNAL_PATH) > JOURNAL_COMPACT_BYTES:
+            _compact(latest)
+
+    status = {}
+    for key, entry in latest.items():
+        if entry['ts'] < cutoff:
+            continue
+        if entry['phase'] == 'intent':
+            status[key] = ('pending', entry['ts'])
+        else:
+            status[key] = ('succeeded' if entry['success'] else 'failed', entry['ts'])
+    return status
+
+# an order's updatedAt (epoch seconds or milliseconds, or an ISO 8601 string) as epoch
+# seconds, None when it can't be read
+def to_timestamp(value):
+    if value is None:
+        return None
+    try:
+        number = float(value)
+        return number / 1000 if number > 1e11 else number
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed.timestamp()
+
+# keep only the latest entry per mutation within the retention window. caller holds _lock
+def _compact(latest):
+    cutoff = time.time() - JOURNAL_RETENTION_DAYS * 86400
+    kept = sorted((entry for entry in latest.values() if entry['ts'] >= cutoff), key=lambda entry: entry['ts'])
+    atomic_write(MUTATION_JOURNAL_PATH, ''.join(json.dumps(entry) + '\n' for entry in kept), fsync=True)
+    logger.info(f'compacted mutation journal to {len(kept)} entries')
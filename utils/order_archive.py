@@ -0,0 +1,66 @@
+import os
+import gzip
+import json
+import mmap
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from utils.local_db import STATE_DIR
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(STATE_DIR, 'archives'))
+ARCHIVE_COMPRESSLEVEL = int(os.getenv('ARCHIVE_COMPRESSLEVEL', '6'))
+
+# recorded API responses, one json object per line in a gzip file:
+#   {"kind": "list", "page": 1, "states": [...], "rows": [...]}     a /api/v2/order/list page
+#   {"kind": "detail", "id": "...", "detail": {...}}                a /api/order/{order_id} response
+#   {"kind": "banned_device_ids", "ids": [...]}                     the block list at record time
+
+class ArchiveWriter:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, 'wt', compresslevel=ARCHIVE_COMPRESSLEVEL, encoding='utf-8')
+        self.counts = {}
+
+    def write(self, kind, **fields):
+        line = json.dumps(dict(kind=kind, **fields), separators=(',', ':'))
+        # detail fetches record from worker threads
+        with self.lock:
+            self.file.write(line)
+            self.file.write('\n')
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+_writer = None # set while responses are being recorded
+
+# cheap no-op unless a recording is running
+def record(kind, **fields):
+    writer = _writer
+    if writer is not None:
+        writer.write(kind, **fields)
+
+# every list page and order detail fetched inside the block is appended to the archive
+@contextmanager
+def recording(path):
+    global _writer
+    writer = ArchiveWriter(path)
+    _writer = writer
+    try:
+        yield writer
+    finally:
+        _writer = None
+        writer.close()
+
+# every record in an archive, in the order it was written. the file is memory-mapped
+# and decompressed as it is read, so nothing but the current line is held in memory
+def iter_records(path):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with gzip.GzipFile(fileobj=mapped, mode='rb') as archive:
+            for line in archive:
+                yield json.loads(line)
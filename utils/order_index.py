@@ -0,0 +1,136 @@
+import time
+import logging
+from utils.local_db import get_connection, chunked
+
+logger = logging.getLogger(__name__)
+
+_schema_ready = False
+
+def _ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_index (
+                order_id TEXT PRIMARY KEY,
+                order_flip_id TEXT,
+                state TEXT,
+                device_id TEXT,
+                shipping_state TEXT,
+                payment_method TEXT,
+                updated_at TEXT,
+                has_detail INTEGER NOT NULL DEFAULT 0,
+                indexed_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_order_index_device ON order_index (device_id, state)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_order_index_state ON order_index (state)")
+    _schema_ready = True
+
+def _text(value):
+    return None if value is None else str(value)
+
+# list rows only carry state/updatedAt, so detail columns are left as they are
+def index_list_rows(rows):
+    if not rows:
+        return
+    _ensure_schema()
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO order_index (order_id, order_flip_id, state, updated_at, indexed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(order_id) DO UPDATE SET
+                order_flip_id = COALESCE(excluded.order_flip_id, order_flip_id),
+                state = excluded.state,
+                updated_at = COALESCE(excluded.updated_at, updated_at),
+                indexed_at = excluded.indexed_at
+            """,
+            [(row['id'], row.get('orderID'), row.get('state'), _text(row.get('updatedAt')), now) for row in rows]
+        )
+
+# takes OrderViews; the device id is stored normalized
+def index_details(orders):
+    records = []
+    now = time.time()
+    for order in orders:
+        device_id = (order.deviceId or '').strip().lower() or None
+        records.append((
+            order.id,
+            order.orderID,
+            order.state,
+            device_id,
+            order.shipping_state,
+            order.paymentMethodCode,
+            _text(order.updatedAt),
+            now
+        ))
+    if not records:
+        return
+    _ensure_schema()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO order_index
+                (order_id, order_flip_id, state, device_id, shipping_state, payment_method, updated_at, has_detail, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT(order_id) DO UPDATE SET
+                order_flip_id = excluded.order_flip_id,
+                state = excluded.state,
+                device_id = excluded.device_id,
+                shipping_state = excluded.shipping_state,
+                payment_method = excluded.payment_method,
+                updated_at = COALESCE(excluded.updated_at, updated_at),
+                has_detail = 1,
+                indexed_at = excluded.indexed_at
+            """,
+            records
+        )
+
+# ids from order_ids whose details were never indexed
+def missing_details(order_ids):
+    _ensure_schema()
+    conn = get_connection()
+    known = set()
+    for chunk in chunked(order_ids):
+        placeholders = ','.join('?' * len(chunk))
+        known.update(row[0] for row in conn.execute(
+            f"SELECT order_id FROM order_index WHERE has_detail = 1 AND order_id IN ({placeholders})", chunk
+        ))
+    return [order_id for order_id in order_ids if order_id not in known]
+
+# after a complete listing of `states`, orders that were not seen have moved on
+def forget_unlisted(states, seen_ids):
+    _ensure_schema()
+    conn = get_connection()
+    placeholders = ','.join('?' * len(states))
+    indexed = [row[0] for row in conn.execute(
+        f"SELECT order_id FROM order_index WHERE state IN ({placeholders})", list(states)
+    )]
+    gone = [(order_id,) for order_id in indexed if order_id not in seen_ids]
+    with conn:
+        conn.executemany("UPDATE order_index SET state = NULL WHERE order_id = ?", gone)
+    if gone:
+        logger.info(f'{len(gone)} indexed orders left states {sorted(states)}')
+
+# [(order_id, order_flip_id, device_id)] for orders in `states` placed from any of device_ids
+def find_orders_by_device(device_ids, states):
+    _ensure_schema()
+    conn = get_connection()
+    state_placeholders = ','.join('?' * len(states))
+    matches = []
+    for chunk in chunked(sorted(device_ids)):
+        placeholders = ','.join('?' * len(chunk))
+        matches.extend(conn.execute(
+            f"""
+            SELECT order_id, order_flip_id, device_id FROM order_index
+            WHERE device_id IN ({placeholders}) AND state IN ({state_placeholders})
+            """,
+            chunk + list(states)
+        ))
+    return matches
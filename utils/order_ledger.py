@@ -0,0 +1,78 @@
+import os
+import time
+import logging
+from utils.local_db import get_connection, chunked
+
+logger = logging.getLogger(__name__)
+
+LEDGER_RETENTION_DAYS = int(os.getenv('LEDGER_RETENTION_DAYS', '14'))
+
+_schema_ready = False
+
+def _ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_ledger (
+                order_id TEXT NOT NULL,
+                policy TEXT NOT NULL,
+                policy_version TEXT,
+                updated_at TEXT,
+                state TEXT,
+                verdict TEXT,
+                evaluated_at REAL,
+                PRIMARY KEY (order_id, policy)
+            )
+        """)
+        # held an updatedAt watermark that nothing read
+        conn.execute("DROP TABLE IF EXISTS ledger_meta")
+    _schema_ready = True
+
+# {(order_id, policy): (policy_version, updated_at, state)} for the given orders
+def load_entries(order_ids):
+    _ensure_schema()
+    conn = get_connection()
+    entries = {}
+    for chunk in chunked(order_ids):
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(
+            f"SELECT order_id, policy, policy_version, updated_at, state FROM order_ledger WHERE order_id IN ({placeholders})",
+            chunk
+        )
+        for order_id, policy, version, updated_at, state in rows:
+            entries[(order_id, policy)] = (version, updated_at, state)
+    return entries
+
+# true when the policy already judged this exact revision of the order
+def is_unchanged(entries, order, policy):
+    updated_at = order.get('updatedAt')
+    if updated_at is None:
+        return False
+    entry = entries.get((order['id'], policy['name']))
+    return entry == (policy.get('version'), str(updated_at), order.get('state'))
+
+# records are (order_id, policy_name, policy_version, updated_at, state, verdict)
+def record(records):
+    if not records:
+        return
+    _ensure_schema()
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO order_ledger VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(order_id, policy, version, None if updated_at is None else str(updated_at), state, verdict, now)
+             for order_id, policy, version, updated_at, state, verdict in records]
+        )
+
+def prune():
+    _ensure_schema()
+    cutoff = time.time() - LEDGER_RETENTION_DAYS * 86400
+    conn = get_connection()
+    with conn:
+        deleted = conn.execute("DELETE FROM order_ledger WHERE evaluated_at < ?", (cutoff,)).rowcount
+    if deleted:
+        logger.info(f'pruned {deleted} ledger entries older than {LEDGER_RETENTION_DAYS} days')
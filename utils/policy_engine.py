@@ -0,0 +1,218 @@
+import re
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# relative cost of each operator, cheap checks run first
+OPERATOR_COSTS = {
+    'eq': 1,
+    'ne': 1,
+    'in': 1,
+    'not_in': 1,
+    'exists': 1,
+    'keywords': 10,
+}
+KEYWORD_CACHE_SIZE = 50000
+
+def resolve(obj, path):
+    for part in path.split('.'):
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            obj = obj.get(part)
+        else:
+            obj = getattr(obj, part, None)
+    return obj
+
+# one pass over the text for all keywords, whole words only (plural allowed) so
+# "bean" matches "coffee beans" but not "beanie"
+def compile_keyword_pattern(keywords):
+    alternatives = '|'.join(sorted(map(re.escape, keywords), key=len, reverse=True))
+    return re.compile(rf'\b(?:{alternatives})s?\b', re.IGNORECASE)
+
+def _normalize(value, how):
+    if value is None or how is None:
+        return value
+    if how == 'lower':
+        return str(value).strip().lower()
+    raise ValueError(f'unknown normalization {how!r}')
+
+def _keywords_predicate(fields, keywords):
+    pattern = compile_keyword_pattern(keywords)
+    verdicts = {}
+
+    # catalog items recur across orders, so verdicts are cached on the text of every
+    # scanned field and each distinct description is only scanned once per process
+    def predicate(obj):
+        cache_key = tuple(resolve(obj, field) for field in fields)
+        if cache_key in verdicts:
+            return verdicts[cache_key]
+        verdict = any(pattern.search(text or '') for text in cache_key)
+        if any(cache_key):
+            if len(verdicts) >= KEYWORD_CACHE_SIZE:
+                verdicts.clear()
+            verdicts[cache_key] = verdict
+        return verdict
+    return predicate
+
+def _build_predicate(rule, params):
+    op = rule['op']
+    value = rule.get('value')
+    if isinstance(value, dict) and 'param' in value:
+        value = params[value['param']]
+    if op == 'keywords':
+        return _keywords_predicate(rule.get('fields') or [rule['field']], value)
+
+    field = rule['field']
+    normalize = rule.get('normalize')
+    if op in ('in', 'not_in'):
+        value = frozenset(_normalize(v, normalize) for v in value)
+    else:
+        value = _normalize(value, normalize)
+
+    if op == 'eq':
+        return lambda obj: _normalize(resolve(obj, field), normalize) == value
+    if op == 'ne':
+        return lambda obj: _normalize(resolve(obj, field), normalize) != value
+    if op == 'in':
+        return lambda obj: _normalize(resolve(obj, field), normalize) in value
+    if op == 'not_in':
+        return lambda obj: _normalize(resolve(obj, field), normalize) not in value
+    if op == 'exists':
+        return lambda obj: resolve(obj, field) is not None
+    raise ValueError(f'unknown operator {op!r}')
+
+# prefilter rules run on list rows, which may not carry the field at all. a
+# missing value never rejects, the order just goes on to the detail fetch
+def _tolerate_missing(rule, predicate):
+    fields = rule.get('fields') or [rule['field']]
+
+    def predicate_or_missing(obj):
+        if all(resolve(obj, field) is None for field in fields):
+            return True
+        return predicate(obj)
+    return predicate_or_missing
+
+def _rule_label(rule):
+    return f"{rule.get('field') or ','.join(rule.get('fields', []))} {rule['op']}"
+
+class CompiledRule:
+    def __init__(self, rule, params, tolerate_missing=False):
+        self.label = _rule_label(rule)
+        self.cost = rule.get('cost', OPERATOR_COSTS[rule['op']])
+        self.predicate = _build_predicate(rule, params)
+        if tolerate_missing:
+            self.predicate = _tolerate_missing(rule, self.predicate)
+        self.evaluations = 0
+        self.matches = 0
+        self.seconds = 0.0
+
+    def __call__(self, obj):
+        start = time.perf_counter()
+        result = self.predicate(obj)
+        self.seconds += time.perf_counter() - start
+        self.evaluations += 1
+        self.matches += result
+        return result
+
+# a policy declared as data, compiled once into cost-ordered predicates.
+# order-level rules run (and short-circuit) before any item-level rule; an order
+# matches when every order rule passes and at least one item passes every item rule.
+# 'prefilter' rules are checked against the order list row before any detail is
+# fetched, so orders the summary already rules out never cost a detail call
+class CompiledPolicy:
+    def __init__(self, spec, params=None):
+        params = params or {}
+        self.name = spec['name']
+        self.action = spec.get('action')
+        self.states = set(spec.get('states', []))
+        self.prefilter_rules = sorted(
+            (CompiledRule(rule, params, tolerate_missing=True) for rule in spec.get('prefilter', [])), key=lambda r: r.cost
+        )
+        self.order_rules = sorted((CompiledRule(rule, params) for rule in spec.get('order', [])), key=lambda r: r.cost)
+        self.item_rules = sorted((CompiledRule(rule, params) for rule in spec.get('items', [])), key=lambda r: r.cost)
+        self.items_path = spec.get('items_path', 'items')
+        self.item_key = spec.get('item_key', 'item')
+        # spec_version ignores runtime params, for callers that track param changes another way
+        self.spec_version = _spec_version(spec, {})
+        self.version = _spec_version(spec, params)
+        self.evaluations = 0
+        self.matches = 0
+        self.seconds = 0.0
+        self.prefiltered = 0
+
+    # false when the list row alone shows the order can't match
+    def prefilter(self, row):
+        for rule in self.prefilter_rules:
+            if not rule(row):
+                self.prefiltered += 1
+                return False
+        return True
+
+    def _matches(self, order):
+        for rule in self.order_rules:
+            if not rule(order):
+                return False
+        if not self.item_rules:
+            return True
+        for line in resolve(order, self.items_path) or []:
+            item = resolve(line, self.item_key) if self.item_key else line
+            if item is not None and all(rule(item) for rule in self.item_rules):
+                return True
+        return False
+
+    # takes an OrderView (or the raw detail['order'] dict), not the whole detail response
+    def evaluate(self, order):
+        start = time.perf_counter()
+        result = self._matches(order)
+        self.seconds += time.perf_counter() - start
+        self.evaluations += 1
+        self.matches += result
+        return result
+
+    def report(self):
+        return {
+            'policy': self.name,
+            'evaluations': self.evaluations,
+            'matches': self.matches,
+            'seconds': round(self.seconds, 6),
+            'prefiltered': self.prefiltered,
+            'rules': [
+                {'rule': f'prefilter {rule.label}', 'evaluations': rule.evaluations, 'matches': rule.matches, 'seconds': round(rule.seconds, 6)}
+                for rule in self.prefilter_rules
+            ] + [
+                {'rule': rule.label, 'evaluations': rule.evaluations, 'matches': rule.matches, 'seconds': round(rule.seconds, 6)}
+                for rule in self.order_rules + self.item_rules
+            ]
+        }
+
+def _spec_version(spec, params):
+    digest = hashlib.sha1()
+    digest.update(repr(_canonical(spec)).encode())
+    digest.update(repr(_canonical(params)).encode())
+    return digest.hexdigest()[:12]
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return sorted((str(k), _canonical(v)) for k, v in value.items())
+    if isinstance(value, (set, frozenset)):
+        return sorted(_canonical(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return repr(value)
+
+def compile_policy(spec, params=None):
+    return CompiledPolicy(spec, params)
+
+def log_report(policy):
+    report = policy.report()
+    logger.info(
+        f"policy {report['policy']}: {report['matches']}/{report['evaluations']} matched in {report['seconds']:.4f}s, "
+        f"{report['prefiltered']} rejected from the list row"
+    )
+    for rule in report['rules']:
+        logger.info(
+            f"  rule {rule['rule']}: {rule['matches']}/{rule['evaluations']} passed in {rule['seconds']:.4f}s"
+        )
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', '30'))
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', '10'))
+
+# wall clock per activity ('network', 'logging'). time counts once while any thread
+# is inside the activity (wall) and once per thread (thread_seconds), so overlapping
+# detail fetches don't add up to more than the run took
+class _Activity:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.since = 0.0
+        self.wall = 0.0
+        self.thread_seconds = 0.0
+        self.calls = 0
+
+    def enter(self):
+        now = time.perf_counter()
+        with self.lock:
+            if self.active == 0:
+                self.since = now
+            self.active += 1
+        return now
+
+    def exit(self, started):
+        now = time.perf_counter()
+        with self.lock:
+            self.active -= 1
+            self.calls += 1
+            self.thread_seconds += now - started
+            if self.active == 0:
+                self.wall += now - self.since
+
+_activities = None # set while a profile is being captured
+
+# cheap no-op unless a profile is running
+@contextmanager
+def activity(name):
+    activities = _activities
+    if activities is None:
+        yield
+        return
+    tracker = activities.setdefault(name, _Activity())
+    started = tracker.enter()
+    try:
+        yield
+    finally:
+        tracker.exit(started)
+
+def _wrap_log_handlers():
+    wrapped = []
+    for handler in logging.getLogger().handlers:
+        original = handler.handle
+
+        def timed_handle(record, original=original):
+            with activity('logging'):
+                return original(record)
+        handler.handle = timed_handle
+        wrapped.append((handler, original))
+    return wrapped
+
+def _profile_directory(name):
+    path = os.path.join(PROFILE_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# before 3.12 cProfile only sees the thread it was enabled on, so every thread
+# started while profiling gets its own profiler and the stats are merged at the end.
+# from 3.12 it sits on sys.monitoring, sees every thread and allows one profiler
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+class _ThreadProfilers:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profilers = []
+
+    def install(self, frame, event, arg):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler already holds the process-wide slot
+            return
+        with self.lock:
+            self.profilers.append(profiler)
+
+def _write_cpu_profile(directory, main_profiler, thread_profilers):
+    stats = pstats.Stats(main_profiler)
+    for profiler in thread_profilers:
+        try:
+            stats.add(profiler)
+        except (TypeError, ValueError):
+            # a thread that never ran any python code has nothing to add
+            continue
+    stats.dump_stats(os.path.join(directory, 'cpu.prof'))
+    with open(os.path.join(directory, 'cpu_top.txt'), 'w') as f:
+        stats.stream = f
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+        stats.sort_stats('tottime').print_stats(PROFILE_TOP_N)
+
+def _write_allocations(directory, snapshot):
+    with open(os.path.join(directory, 'allocations.txt'), 'w') as f:
+        f.write(f'top {PROFILE_TOP_N} allocation sites by size\n\n')
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP_N]:
+            f.write(f'{stat}\n')
+        f.write(f'\ntop {PROFILE_TOP_N} allocation tracebacks by size\n\n')
+        for stat in snapshot.statistics('traceback')[:PROFILE_TOP_N]:
+            f.write(f'{stat.size / 1024:.1f} KiB in {stat.count} blocks\n')
+            for line in stat.traceback.format():
+                f.write(f'{line}\n')
+            f.write('\n')
+
+def _breakdown(wall, cpu, activities):
+    network = activities.get('network', _Activity())
+    logging_time = activities.get('logging', _Activity())
+    return {
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'network_wait_seconds': round(network.wall, 4),
+        'network_thread_seconds': round(network.thread_seconds, 4),
+        'network_calls': network.calls,
+        'logging_seconds': round(logging_time.wall, 4),
+        'logging_thread_seconds': round(logging_time.thread_seconds, 4),
+        'log_records': logging_time.calls,
+        # time with no request in flight, spent on python work (including logging)
+        'compute_seconds': round(max(wall - network.wall, 0.0), 4),
+    }
+
+# captures a CPU profile of every thread, a tracemalloc top-N and a wall-clock
+# breakdown of the wrapped block into PROFILE_DIR/<name>-<timestamp>/
+@contextmanager
+def profiled(name, enabled=True):
+    global _activities
+    if not enabled:
+        yield None
+        return
+
+    directory = _profile_directory(name)
+    thread_profilers = _ThreadProfilers()
+    _activities = {}
+    wrapped_handlers = _wrap_log_handlers()
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    if PER_THREAD_PROFILERS:
+        threading.setprofile(thread_profilers.install)
+    main_profiler = cProfile.Profile()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    main_profiler.enable()
+    try:
+        yield directory
+    finally:
+        main_profiler.disable()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        if PER_THREAD_PROFILERS:
+            threading.setprofile(None)
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        for handler, original in wrapped_handlers:
+            handler.handle = original
+        activities, _activities = _activities, None
+
+        _write_cpu_profile(directory, main_profiler, thread_profilers.profilers)
+        _write_allocations(directory, snapshot)
+        breakdown = _breakdown(wall, cpu, activities)
+        with open(os.path.join(directory, 'breakdown.json'), 'w') as f:
+            json.dump(breakdown, f, indent=2)
+        logger.info(
+            f"profile for {name} written to {directory}: {breakdown['wall_seconds']}s wall, "
+            f"{breakdown['network_wait_seconds']}s waiting on network, {breakdown['compute_seconds']}s compute, "
+            f"{breakdown['logging_seconds']}s logging, {breakdown['cpu_seconds']}s cpu"
+        )
@@ -0,0 +1,27 @@
+import os
+import json
+
+# write to a temp file next to `path` and rename it over the original, so readers
+# (and a crash mid-write) only ever see the old or the new file. bytes are written
+# as-is; mode restricts the file's permissions, e.g. 0o600 for secrets
+def atomic_write(path, content, mode=None, fsync=False):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    binary = isinstance(content, bytes)
+    if mode is None:
+        f = open(tmp_path, 'wb' if binary else 'w')
+    else:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        f = os.fdopen(fd, 'wb' if binary else 'w')
+    with f:
+        f.write(content)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    if mode is not None:
+        # os.open's mode is masked by the umask
+        os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+def atomic_write_json(path, data, mode=None, **dump_options):
+    atomic_write(path, json.dumps(data, **dump_options), mode=mode)